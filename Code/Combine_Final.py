@@ -3,7 +3,20 @@ import sys
 import PIL
 from tkinter import *
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
+from PIL import Image
+from image_cache import ImageCache, DEFAULT_CACHE_BYTES
+from prefetch import PrefetchScheduler
+from combiner import combine_full, display_size, frame_key, list_stimuli, render_pair, render_pair_cached, unique_stimuli
+from grid_renderer import MAX_GRID, GridRenderer, grid_pairs
+from frame_presenter import FramePresenter
+from seam_match import BoundaryIndex, SeamMatcher
+from optional_numpy import np
+from thumb_store import ThumbnailStore, DEFAULT_THUMB_BYTES
+from pixel_pack import forget_pack, open_pack, packed_preview, packed_stimulus
+from latency_trace import phase, tracer
+from save_queue import SaveQueue
+from dedup import DEFAULT_THRESHOLD
+from batch_render import output_names, pair_filename
 
 # --Debugging--
 # Silence macOS Tk warnings
@@ -18,15 +31,25 @@ def clear_terminal():
     else:
         _ = os.system('clear')
 
-clear_terminal()
-
-# Confirm PIL
-print(PIL.__version__)
+# Progressive rendering: frames not rendered yet are first drawn with a quick bilinear
+# preview, then redrawn with LANCZOS once navigation has paused this long
+REFINE_DELAY_MS = 150
 
 # --Application--
 class ImageCombinerApp:
-    def __init__(self, root):
+    def __init__(self, root, cache_bytes=DEFAULT_CACHE_BYTES, png_compress_level=6, thumb_bytes=DEFAULT_THUMB_BYTES,
+                 trace_path=None):
         self.root = root
+        self.include_subfolders = BooleanVar(master=root, value=False)
+        self.pack_stimuli = BooleanVar(master=root, value=False)
+        self.skip_duplicates = BooleanVar(master=root, value=False)
+        # Hashes at most this many bits apart (of 256) count as the same stimulus
+        self.duplicate_bits = IntVar(master=root, value=DEFAULT_THRESHOLD)
+        # Up/Down only visit bottoms whose inked edge columns line up with the current top
+        self.compatible_only = BooleanVar(master=root, value=False)
+        # Grid view size: tops across, bottoms down
+        self.grid_cols = IntVar(master=root, value=3)
+        self.grid_rows = IntVar(master=root, value=3)
         self.root.title("Image Combiner (macOS + Windows Compatible)")
         self.root.geometry("1000x700")
 
@@ -35,9 +58,38 @@ class ImageCombinerApp:
         self.folder2_images = []
         self.current_top = 0
         self.current_bottom = 0
-        self.current_combined = None
+        self.current_pair = None  # (top index, bottom index) last shown in single view, until a folder is reloaded
         self.display_mode = "single"  # single/grid
 
+        # Decoded stimuli shared by single view, grid view and save (LRU, byte budget)
+        self.image_cache = ImageCache(cache_bytes)
+        # Output sizes of the last render, read by the prefetch threads
+        self.view_size = None
+        self.cell_size = None
+        # Grid cells are built in parallel from per-stimulus thumbnails kept on disk between sessions
+        self.grid_renderer = GridRenderer(self.image_cache, store=ThumbnailStore(max_bytes=thumb_bytes))
+        # Warms neighbouring pairs on worker threads while the user navigates
+        self.prefetcher = PrefetchScheduler(self.warm_pair)
+        # Saves are composited and encoded on a writer thread; results show in the info label
+        self.save_queue = SaveQueue(self.render_full, compress_level=png_compress_level)
+        self.save_folder = None  # Last folder saved to, used by quick save
+        # Navigation only moves the indices; one redraw of the latest state runs when Tk is idle
+        self.display_job = None
+        self.display_requests = 0  # navigation events folded into the pending redraw
+        self.refine_job = None  # pending full-quality pass over a preview frame
+        # Per-redraw latency with a phase breakdown; F3 toggles the on-canvas HUD
+        self.trace_path = trace_path
+        self.show_hud = False
+        tracer.enabled = bool(trace_path)
+        # Best-match navigation: every pair ranked by how well the lines continue across the seam
+        self.seam_matcher = SeamMatcher(self.image_cache)
+        self.match_ranking = None  # (top indices, bottom indices, scores), best first
+        self.match_pos = -1
+        self.top_source = self.bottom_source = None  # (folder, recursive) each list came from
+        self.boundary_index = None  # built from the edge signatures in the folder manifests
+        self.skipped = {}  # folder -> duplicate stimuli left out when it was loaded
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # UI Setup
         self.setup_ui()
 
@@ -48,8 +100,19 @@ class ImageCombinerApp:
 
         Button(control_frame, text="Select Top Line Stimuli", command=self.load_folder1).pack(side=LEFT, padx=5)
         Button(control_frame, text="Select Bottom Line Stimuli", command=self.load_folder2).pack(side=LEFT, padx=5)
+        Checkbutton(control_frame, text="Include Subfolders", variable=self.include_subfolders).pack(side=LEFT, padx=5)
+        Checkbutton(control_frame, text="Pack Stimuli", variable=self.pack_stimuli).pack(side=LEFT, padx=5)
+        Checkbutton(control_frame, text="Skip Duplicates", variable=self.skip_duplicates).pack(side=LEFT, padx=(5, 0))
+        Spinbox(control_frame, from_=0, to=32, width=3, textvariable=self.duplicate_bits,
+                state="readonly").pack(side=LEFT, padx=2)
         Button(control_frame, text="Toggle View", command=self.toggle_view).pack(side=LEFT, padx=5)
+        Label(control_frame, text="Grid").pack(side=LEFT, padx=(5, 0))
+        for var in (self.grid_cols, self.grid_rows):
+            Spinbox(control_frame, from_=1, to=MAX_GRID, width=3, textvariable=var, state="readonly",
+                    command=self.grid_changed).pack(side=LEFT, padx=2)
         Button(control_frame, text="Save Combined", command=self.save_combined).pack(side=LEFT, padx=5)
+        Button(control_frame, text="Best Matches", command=self.next_match).pack(side=LEFT, padx=5)
+        Checkbutton(control_frame, text="Compatible Only", variable=self.compatible_only).pack(side=LEFT, padx=5)
 
         # Info label
         self.info_label = Label(self.root, text="", font=("Arial", 12), anchor="w", justify=LEFT)
@@ -58,6 +121,8 @@ class ImageCombinerApp:
         # Canvas for images
         self.canvas = Canvas(self.root, bg="#222")
         self.canvas.pack(fill=BOTH, expand=True)
+        # Persistent canvas items and PhotoImages, updated in place every frame
+        self.presenter = FramePresenter(self.canvas)
 
         # Keyboard shortcuts
         self.root.bind("<Left>", lambda e: self.prev_top())
@@ -66,69 +131,175 @@ class ImageCombinerApp:
         self.root.bind("<Down>", lambda e: self.next_bottom())
         self.root.bind("<Tab>", lambda e: self.toggle_view())
         self.root.bind("<Return>", lambda e: self.save_combined())
+        self.root.bind("<Shift-Return>", lambda e: self.quick_save())
+        self.root.bind("<F3>", lambda e: self.toggle_hud())
+        self.root.bind("<bracketright>", lambda e: self.next_match())
+        self.root.bind("<bracketleft>", lambda e: self.prev_match())
 
     # Folder + Image Loading
     def load_folder1(self):
         folder = filedialog.askdirectory(title="Select Folder 1")
         if folder:
+            self.top_source = (folder, self.include_subfolders.get())
             self.folder1_images = self.load_images_from_folder(folder)
             self.current_top = 0
+            self.match_ranking = None
+            self.boundary_index = None
+            self.current_pair = None
             self.update_display()
 
     def load_folder2(self):
         folder = filedialog.askdirectory(title="Select Folder 2")
         if folder:
+            self.bottom_source = (folder, self.include_subfolders.get())
             self.folder2_images = self.load_images_from_folder(folder)
             self.current_bottom = 0
+            self.match_ranking = None
+            self.boundary_index = None
+            self.current_pair = None
             self.update_display()
 
     def load_images_from_folder(self, folder):
-        valid_exts = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tiff")
-        files = [os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(valid_exts)]
-        files.sort()
-        return files
+        # Indexed with os.scandir; sizes and dimensions persist in a manifest next to the stimuli
+        recursive = self.include_subfolders.get()
+        if self.skip_duplicates.get():
+            # Near-identical stimuli (re-exports, other formats) are collapsed to the best copy
+            self.info_label.config(text="Checking stimuli for duplicates…")
+            self.root.update_idletasks()
+            paths, duplicates = unique_stimuli(folder, recursive=recursive, threshold=self.duplicate_bits.get(),
+                                               progress=self.hash_progress)
+            self.skipped[folder] = len(duplicates)
+        else:
+            paths = list_stimuli(folder, recursive=recursive)
+            self.skipped.pop(folder, None)
+        # A pack from an earlier load of this folder is only used while "Pack Stimuli" is ticked
+        forget_pack(paths)
+        if self.pack_stimuli.get():
+            # Decoded once into a memory-mapped pack; single view then renders straight from the map
+            self.info_label.config(text=f"Packing {len(paths)} stimuli…")
+            self.root.update_idletasks()
+            try:
+                open_pack(folder, paths, recursive)
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not pack folder, using the image files: {e}")
+        return paths
+
+    def hash_progress(self, done, total):
+        # Only stimuli new to the manifest are hashed; the label is refreshed every 1%
+        if done == total or done % max(1, total // 100) == 0:
+            self.info_label.config(text=f"Checking stimuli for duplicates… {done} of {total}")
+            self.root.update_idletasks()
 
     # Image Combination + Display
-    def combine_images(self, img1_path, img2_path):
+    # Full resolution, only built when saving
+    def render_full(self, img1_path, img2_path):
+        # Runs on the save writer thread, errors are reported by the save queue
+        return combine_full(self.image_cache.load(img1_path), self.image_cache.load(img2_path))
+
+    # Display resolution: each half is decoded reduced and resized straight to its place on screen
+    def render_pair(self, img1_path, img2_path, preview=False):
+        # Returns (image or None, final); with preview a frame that is not cached yet comes
+        # back as a quick bilinear render with final False
         try:
-            img1 = Image.open(img1_path).convert("RGBA")
-            img2 = Image.open(img2_path).convert("RGBA")
+            out_w, out_h = display_size(img1_path, img2_path, *self.view_size)
+            if preview:
+                frame = self.image_cache.get(frame_key(img1_path, img2_path, out_w, out_h))
+                if frame is not None:
+                    return frame, True
+                return render_pair(self.image_cache, img1_path, img2_path, out_w, out_h, packed_preview), False
+            return render_pair_cached(self.image_cache, img1_path, img2_path, out_w, out_h, packed_stimulus), True
         except Exception as e:
             messagebox.showerror("Error", f"Could not open image: {e}")
-            return None
-
-        # Resize to same width
-        width = min(img1.width, img2.width)
-        img1 = img1.resize((width, int(img1.height * width / img1.width)))
-        img2 = img2.resize((width, int(img2.height * width / img2.width)))
-
-        combined_height = img1.height + img2.height
-        combined = Image.new("RGBA", (width, combined_height))
-        combined.paste(img1, (0, 0))
-        combined.paste(img2, (0, img1.height))
+            return None, True
 
-        return combined.convert("RGB")
-
-    def update_display(self):
-        self.canvas.delete("all")
+    def warm_pair(self, img1_path, img2_path):
+        # Runs on a prefetch thread
+        if self.display_mode == "grid":
+            self.grid_renderer.render_cell(img1_path, img2_path, *self.cell_size)
+        else:
+            out_w, out_h = display_size(img1_path, img2_path, *self.view_size)
+            render_pair_cached(self.image_cache, img1_path, img2_path, out_w, out_h, packed_stimulus)
+
+    def request_display(self):
+        # Holding an arrow key queues events faster than frames can be drawn: each event just
+        # bumps the index, and every event that arrives before the redraw runs shares it
+        self.cancel_refine()
+        self.display_requests += 1
+        if self.display_job is None:
+            self.display_job = self.root.after_idle(self.flush_display)
+
+    def flush_display(self):
+        self.display_job = None
+        self.update_display()
 
+    def cancel_refine(self):
+        # The user moved on: the full-quality pass would be for a frame no longer wanted
+        if self.refine_job is not None:
+            self.root.after_cancel(self.refine_job)
+            self.refine_job = None
+
+    def refine_display(self):
+        self.refine_job = None
+        self.update_display(preview=False)
+
+    def update_display(self, preview=True):
+        if self.display_job is not None:
+            # Drawing now, so the pending redraw would be stale
+            self.root.after_cancel(self.display_job)
+            self.display_job = None
+        self.cancel_refine()
+        coalesced, self.display_requests = self.display_requests, 0
+        with tracer.event("update_display" if preview else "refine_display", mode=self.display_mode,
+                          coalesced=coalesced, top=self.current_top, bottom=self.current_bottom):
+            if not self.draw_display(preview):
+                self.refine_job = self.root.after(REFINE_DELAY_MS, self.refine_display)
+            if tracer.enabled:
+                # Tk draws when idle; flushing here puts its cost inside the event
+                with phase("tk_draw"):
+                    self.root.update_idletasks()
+        if self.show_hud:
+            self.draw_hud()
+
+    def draw_display(self, preview=False):
+        # Returns False when a preview was drawn and the full-quality pass is still to come
         if not self.folder1_images or not self.folder2_images:
+            self.presenter.clear()
             self.info_label.config(text="Please select both folders.")
-            return
+            return True
 
         if self.display_mode == "single":
-            combined = self.combine_images(
-                self.folder1_images[self.current_top],
-                self.folder2_images[self.current_bottom],
-            )
+            canvas_w = self.canvas.winfo_width()
+            canvas_h = self.canvas.winfo_height()
+            if canvas_w < 10 or canvas_h < 10:
+                self.root.after(200, self.request_display)
+                return True
+
+            self.view_size = (canvas_w, canvas_h)
+            pair = (self.folder1_images[self.current_top], self.folder2_images[self.current_bottom])
+            combined, final = self.render_pair(*pair, preview=preview)
             if combined:
                 self.show_image(combined)
-                self.current_combined = combined
+                self.current_pair = (self.current_top, self.current_bottom)
                 self.info_label.config(
                     text=f"Single View — Top: {os.path.basename(self.folder1_images[self.current_top])} | "
-                         f"Bottom: {os.path.basename(self.folder2_images[self.current_bottom])}"
+                         f"Bottom: {os.path.basename(self.folder2_images[self.current_bottom])}{self.match_text()}{self.skipped_text()}"
                 )
-        else: self.show_grid()
+            else:
+                self.presenter.clear()
+        else: final = self.show_grid(preview)
+
+        self.schedule_prefetch()
+        return final
+
+    def schedule_prefetch(self):
+        if not self.folder1_images or not self.folder2_images:
+            return
+        if self.display_mode == "grid":
+            top_span, bottom_span = self.grid_shape()
+        else:
+            top_span = bottom_span = 1
+        self.prefetcher.update(self.folder1_images, self.folder2_images,
+                               self.current_top, self.current_bottom, top_span, bottom_span)
 
 
     def show_image(self, image):
@@ -137,7 +308,8 @@ class ImageCombinerApp:
         canvas_h = self.canvas.winfo_height()
 
         if canvas_w < 10 or canvas_h < 10:
-            self.root.after(200, lambda: self.show_image(image))
+            # Redraw whatever is current by then rather than this (possibly stale) frame
+            self.root.after(200, self.request_display)
             return
 
         img_ratio = image.width / image.height
@@ -150,75 +322,218 @@ class ImageCombinerApp:
             new_h = canvas_h
             new_w = int(new_h * img_ratio)
 
-        resized = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        self.tk_img = ImageTk.PhotoImage(resized)  # Keep reference
-        self.canvas.create_image(canvas_w // 2, canvas_h // 2, image=self.tk_img, anchor="center")
+        # Frames from render_pair already fit the canvas
+        with phase("resize"):
+            resized = image if image.size == (new_w, new_h) else image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        with phase("photo_paste"):
+            self.presenter.show_frame(resized, canvas_w, canvas_h)
 
-    def show_grid(self):
-        self.canvas.delete("all")
-        cols = min(3, len(self.folder1_images))
-        rows = min(3, len(self.folder2_images))
+    def show_grid(self, preview=False):
+        # Returns False if some cells are previews awaiting the full-quality pass
+        cols, rows = self.grid_shape()
         cell_w = self.canvas.winfo_width() // cols
         cell_h = self.canvas.winfo_height() // rows
 
         if cell_w < 10 or cell_h < 10:
-            self.root.after(200, self.show_grid)
-            return
-
-        for r in range(rows):
-            for c in range(cols):
-                top_idx = (self.current_top + c) % len(self.folder1_images)
-                bottom_idx = (self.current_bottom + r) % len(self.folder2_images)
-                combined = self.combine_images(
-                    self.folder1_images[top_idx],
-                    self.folder2_images[bottom_idx],
-                )
-                if combined:
-                    thumb = combined.resize((cell_w, cell_h), Image.Resampling.LANCZOS)
-                    img_tk = ImageTk.PhotoImage(thumb)
-                    self.canvas.create_image(c * cell_w, r * cell_h, image=img_tk, anchor="nw")
-                    # Keep references to prevent GC
-                    if not hasattr(self, "thumbs"):
-                        self.thumbs = []
-                    self.thumbs.append(img_tk)
-
-        self.info_label.config(text=f"Grid View — Top Index {self.current_top}, Bottom Index {self.current_bottom}")
+            self.root.after(200, self.request_display)
+            return True
+        self.cell_size = (cell_w, cell_h)
+
+        pairs = grid_pairs(self.folder1_images, self.folder2_images,
+                           self.current_top, self.current_bottom, cols, rows)
+        # Cells are rendered on worker threads; their own phases show as separate spans in the trace
+        with phase("grid_render"):
+            cells = self.grid_renderer.render(pairs, cell_w, cell_h, preview)
+        error = next((err for *_, err in cells if err), None)
+        complete = all(final for _, _, _, _, thumb, final, _ in cells if thumb is not None)
+        # Cells that did not change since the last frame are not pasted again
+        with phase("photo_paste"):
+            self.presenter.show_cells([(r, c, thumb) for r, c, _, _, thumb, _, _ in cells], cell_w, cell_h)
+
+        if error:
+            messagebox.showerror("Error", f"Could not open image: {error}")
+
+        self.info_label.config(text=f"Grid View — Top Index {self.current_top}, Bottom Index {self.current_bottom}"
+                                    f"{self.skipped_text()}")
+        return complete
+
+    def grid_shape(self):
+        # (cols, rows), never more than there are stimuli to show
+        return (min(self.grid_cols.get(), len(self.folder1_images)),
+                min(self.grid_rows.get(), len(self.folder2_images)))
+
+    def grid_changed(self):
+        if self.display_mode == "grid":
+            self.request_display()
 
     # Navigation + Save
     def next_top(self):
         if self.folder1_images:
             self.current_top = (self.current_top + 1) % len(self.folder1_images)
-            self.update_display()
+            self.request_display()
 
     def prev_top(self):
         if self.folder1_images:
             self.current_top = (self.current_top - 1) % len(self.folder1_images)
-            self.update_display()
+            self.request_display()
 
     def next_bottom(self):
         if self.folder2_images:
+            if self.compatible_only.get() and self.folder1_images:
+                self.step_compatible(1)
+                return
             self.current_bottom = (self.current_bottom + 1) % len(self.folder2_images)
-            self.update_display()
+            self.request_display()
 
     def prev_bottom(self):
         if self.folder2_images:
+            if self.compatible_only.get() and self.folder1_images:
+                self.step_compatible(-1)
+                return
             self.current_bottom = (self.current_bottom - 1) % len(self.folder2_images)
-            self.update_display()
+            self.request_display()
+
+    def step_compatible(self, direction):
+        if self.boundary_index is None:
+            if np is None:
+                messagebox.showerror("Error", "Compatible Only needs NumPy (pip install numpy).")
+                self.compatible_only.set(False)
+                return
+            # Signatures are read from the folder manifests; only new stimuli are decoded
+            self.info_label.config(text="Indexing stimulus edges…")
+            self.root.update_idletasks()
+            self.boundary_index = BoundaryIndex.from_folders(self.top_source, self.folder1_images,
+                                                             self.bottom_source, self.folder2_images)
+        bottom = self.boundary_index.step(self.current_top, self.current_bottom, direction)
+        if bottom is None:
+            self.info_label.config(text="No bottom stimuli line up with this top.")
+            return
+        self.current_bottom = bottom
+        self.request_display()
 
     def toggle_view(self):
         self.display_mode = "grid" if self.display_mode == "single" else "single"
-        self.update_display()
+        self.request_display()
+
+    # Best Matches
+    def next_match(self):
+        self.step_match(1)
+
+    def prev_match(self):
+        self.step_match(-1)
+
+    def step_match(self, step):
+        # ] / [ walk all pairs from the best seam to the worst
+        if not self.folder1_images or not self.folder2_images:
+            return
+        if self.match_ranking is None:
+            if np is None:
+                messagebox.showerror("Error", "Best Matches needs NumPy (pip install numpy).")
+                return
+            self.info_label.config(text=f"Scoring {len(self.folder1_images)} x {len(self.folder2_images)} pairs…")
+            self.root.update_idletasks()
+            self.match_ranking = self.seam_matcher.ranking(self.folder1_images, self.folder2_images)
+            self.match_pos = -1
+        tops, bottoms, _ = self.match_ranking
+        self.match_pos = (self.match_pos + step) % len(tops)
+        self.current_top = int(tops[self.match_pos])
+        self.current_bottom = int(bottoms[self.match_pos])
+        self.display_mode = "single"
+        self.request_display()
+
+    def skipped_text(self):
+        # Duplicates "Skip Duplicates" left out of the folders on screen
+        folders = {source[0] for source in (self.top_source, self.bottom_source) if source}
+        count = sum(self.skipped.get(folder, 0) for folder in folders)
+        return f" | {count} duplicate stimuli skipped" if count else ""
+
+    def match_text(self):
+        # Rank of the pair on screen, while it is the one best-match navigation went to
+        if self.match_ranking is None:
+            return ""
+        tops, bottoms, scores = self.match_ranking
+        if (tops[self.match_pos], bottoms[self.match_pos]) != (self.current_top, self.current_bottom):
+            return ""
+        return f" | Match {self.match_pos + 1} of {len(tops)} ({scores[self.match_pos]:.0%})"
 
     def save_combined(self):
-        if self.current_combined:
+        if self.current_pair:
             file_path = filedialog.asksaveasfilename(defaultextension=".png",
                                                      filetypes=[("PNG", "*.png"), ("JPEG", "*.jpg")])
             if file_path:
-                self.current_combined.save(file_path)
-                messagebox.showinfo("Saved", f"Saved combined image to:\n{file_path}")
+                self.save_folder = os.path.dirname(file_path)
+                self.queue_save(file_path)
+
+    def quick_save(self):
+        # Shift+Enter: no dialog, <top>__<bottom>.png into the folder last saved to
+        if not self.current_pair:
+            return
+        if not self.save_folder:
+            self.save_combined()
+            return
+        top_idx, bottom_idx = self.current_pair
+        top_name = output_names(self.folder1_images)[top_idx]
+        bottom_name = output_names(self.folder2_images)[bottom_idx]
+        self.queue_save(os.path.join(self.save_folder, pair_filename(top_name, bottom_name, "png")))
+
+    def queue_save(self, file_path):
+        top_idx, bottom_idx = self.current_pair
+        self.save_queue.submit(self.folder1_images[top_idx], self.folder2_images[bottom_idx], file_path)
+        self.info_label.config(text=f"Saving {os.path.basename(file_path)} ({self.save_queue.pending} queued)")
+        if self.save_queue.pending == 1:
+            self.root.after(100, self.poll_saves)
+
+    def poll_saves(self):
+        for file_path, error in self.save_queue.poll():
+            if error:
+                self.info_label.config(text=f"Save failed — {os.path.basename(file_path)}: {error}")
+            else:
+                pending = f" ({self.save_queue.pending} still queued)" if self.save_queue.pending else ""
+                self.info_label.config(text=f"Saved {file_path}{pending}")
+        if self.save_queue.pending:
+            self.root.after(100, self.poll_saves)
+
+    # Latency HUD
+    def toggle_hud(self):
+        self.show_hud = not self.show_hud
+        # The HUD needs events to show, so it switches tracing on; it stays on for the export
+        tracer.enabled = tracer.enabled or self.show_hud
+        self.canvas.delete("hud")
+        if self.show_hud:
+            self.draw_hud()
+
+    def draw_hud(self):
+        self.canvas.delete("hud")
+        self.canvas.create_text(8, 8, text=tracer.hud_text(), anchor="nw", fill="#7CFC00",
+                                font=("Courier", 11), tags="hud")
+
+    def on_close(self):
+        if self.trace_path:
+            try:
+                tracer.export_chrome(self.trace_path)
+            except OSError as e:
+                print(f"Could not write trace: {e}", file=sys.stderr)
+        self.prefetcher.shutdown()
+        self.grid_renderer.shutdown()
+        # Let queued saves finish writing
+        self.save_queue.shutdown(wait=True)
+        self.root.destroy()
 
 
 if __name__ == "__main__":
+    clear_terminal()
+    # Confirm PIL
+    print(PIL.__version__)
+
     root = Tk()
-    app = ImageCombinerApp(root)
+    # Optional override of the decoded-image cache budget, e.g. MATCHPROGRAM_CACHE_MB=1024
+    cache_mb = os.environ.get("MATCHPROGRAM_CACHE_MB")
+    # PNG compression for saves, 0 (fastest) to 9 (smallest), e.g. MATCHPROGRAM_PNG_LEVEL=1
+    png_level = int(os.environ.get("MATCHPROGRAM_PNG_LEVEL", 6))
+    # Disk budget for the persistent grid thumbnails, e.g. MATCHPROGRAM_THUMB_MB=1024
+    thumb_mb = os.environ.get("MATCHPROGRAM_THUMB_MB")
+    # Latency tracing: MATCHPROGRAM_TRACE=trace.json writes a Chrome trace of every redraw on close
+    trace_path = os.environ.get("MATCHPROGRAM_TRACE")
+    app = ImageCombinerApp(root, int(cache_mb) * 1024 * 1024 if cache_mb else DEFAULT_CACHE_BYTES, png_level,
+                           int(thumb_mb) * 1024 * 1024 if thumb_mb else DEFAULT_THUMB_BYTES, trace_path)
     root.mainloop()
@@ -1,8 +1,15 @@
 import os
 import sys
+import PIL
 from tkinter import *
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
+from virtual_gallery import VirtualGallery
+from image_cache import ImageCache
+from session_store import SessionStore
+from combiner import combine_full, display_size, for_display, render_pair_cached, stimulus_thumbnail
+from batch_render import output_names, pair_filename
+from save_queue import SaveQueue
 
 # Debugging
 # Silence macOS Tk warnings
@@ -17,11 +24,6 @@ def clear_terminal():
     else:
         _ = os.system('clear')
 
-clear_terminal()
-
-# Confirm PIL
-print(PIL.__version__)
-
 # --Application--
 class ImageCombinerApp:
     def __init__(self, root):
@@ -36,9 +38,16 @@ class ImageCombinerApp:
         self.current_bottom = 0
         self.current_combined = None
         self.display_mode = "single"  # single/grid/stored
+        # Every combination viewed this session, as paths only; pixels come back through the cache
+        self.session = SessionStore()
+        self.image_cache = ImageCache()
+        # Stored combinations are composited and written off the Tk thread
+        self.save_queue = SaveQueue(self.render_full)
+        self.save_errors = []  # "<file>: <error>" for failed saves since the queue was last idle
 
         # UI Setup
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_ui(self):
         # Top frame for controls
@@ -49,6 +58,7 @@ class ImageCombinerApp:
         Button(control_frame, text="Select Bottom Line Stimuli", command=self.load_folder2).pack(side=LEFT, padx=5)
         Button(control_frame, text="Toggle View", command=self.toggle_view).pack(side=LEFT, padx=5)
         Button(control_frame, text="Save Combined", command=self.save_combined).pack(side=LEFT, padx=5)
+        Button(control_frame, text="Save Stored", command=self.save_stored).pack(side=LEFT, padx=5)
 
         # Info label
         self.info_label = Label(self.root, text="", font=("Arial", 12), anchor="w", justify=LEFT)
@@ -57,7 +67,7 @@ class ImageCombinerApp:
         # Canvas for images
         self.canvas = Canvas(self.root, bg="black")
         self.canvas.pack(fill=BOTH, expand=True)
-        self.stored_canvas = None
+        self.gallery = None  # Stored view, built on first use
 
         # Keyboard shortcuts
         self.root.bind("<Left>", lambda e: self.prev_top())
@@ -91,39 +101,35 @@ class ImageCombinerApp:
     # Image Combination + Display
     def combine_images(self, img1_path, img2_path):
         try:
-            img1 = Image.open(img1_path).convert("RGBA")
-            img2 = Image.open(img2_path).convert("RGBA")
+            img1 = self.image_cache.load(img1_path)
+            img2 = self.image_cache.load(img2_path)
         except Exception as e:
             messagebox.showerror("Error", f"Could not open image: {e}")
             return None
 
-        # Resize to same width
-        width = min(img1.width, img2.width)
-        img1 = img1.resize((width, int(img1.height * width / img1.width)))
-        img2 = img2.resize((width, int(img2.height * width / img2.width)))
+        return combine_full(img1, img2)
 
-        combined_height = img1.height + img2.height
-        combined = Image.new("RGBA", (width, combined_height))
-        combined.paste(img1, (0, 0))
-        combined.paste(img2, (0, img1.height))
-
-        return combined.convert("RGB")
+    def render_full(self, img1_path, img2_path):
+        # Runs on the save writer thread, errors are reported by the save queue
+        return combine_full(self.image_cache.load(img1_path), self.image_cache.load(img2_path))
 
     def update_display(self):
         self.canvas.delete("all")
+        if self.gallery and self.display_mode != "stored":
+            self.gallery.pack_forget()
 
         if not self.folder1_images or not self.folder2_images:
             self.info_label.config(text="Please select both folders.")
             return
 
         if self.display_mode == "single":
-            combined = self.combine_images(
-                self.folder1_images[self.current_top],
-                self.folder2_images[self.current_bottom],
-            )
+            top_path = self.folder1_images[self.current_top]
+            bottom_path = self.folder2_images[self.current_bottom]
+            combined = self.combine_images(top_path, bottom_path)
             if combined:
                 self.show_image(combined)
                 self.current_combined = combined
+                self.session.add(top_path, bottom_path)
                 self.info_label.config(
                     text=f"Top: {os.path.basename(self.folder1_images[self.current_top])} | "
                          f"Bottom: {os.path.basename(self.folder2_images[self.current_bottom])}"
@@ -153,7 +159,7 @@ class ImageCombinerApp:
             new_w = int(new_h * img_ratio)
 
         resized = image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        self.tk_img = ImageTk.PhotoImage(resized)  # Keep reference
+        self.tk_img = ImageTk.PhotoImage(for_display(resized))  # Keep reference
         self.canvas.create_image(canvas_w // 2, canvas_h // 2, image=self.tk_img, anchor="center")
 
     def show_grid(self):
@@ -177,7 +183,7 @@ class ImageCombinerApp:
                 )
                 if combined:
                     thumb = combined.resize((cell_w, cell_h), Image.Resampling.LANCZOS)
-                    img_tk = ImageTk.PhotoImage(thumb)
+                    img_tk = ImageTk.PhotoImage(for_display(thumb))
                     self.canvas.create_image(c * cell_w, r * cell_h, image=img_tk, anchor="nw")
                     # Keep references to prevent GC
                     if not hasattr(self, "thumbs"):
@@ -187,45 +193,26 @@ class ImageCombinerApp:
         self.info_label.config(text=f"Grid View — Top Index {self.current_top}, Bottom Index {self.current_bottom}")
 
     def show_stored(self):
-        if not self.combine_images: 
+        if not len(self.session):
+            self.info_label.config(text="No stored combinations yet.")
             return
 
-        # Create grid canvas if it doesn't exist
-        if self.stored_canvas is None:
-            self.stored_canvas = Canvas(self.canvas, bg="#333")  # Updated parent frame and bg color
-            self.scroll_y = Scrollbar(self.canvas, orient="vertical", command=self.stored_canvas.yview)
-            self.stored_canvas.configure(yscrollcommand=self.scroll_y.set)
-            self.stored_canvas.pack(side=LEFT, fill=BOTH, expand=True)
-            self.scroll_y.pack(side=RIGHT, fill=Y)
-
-        # Clear previous content
-        self.stored_canvas.delete("all")
-        grid_frame = Frame(self.stored_canvas, bg="#333")  # Updated bg color
-        self.stored_canvas.create_window((0, 0), window=grid_frame, anchor="nw")
-
-        # Updated thumbnail parameters
-        thumb_size = 300  # Larger thumbnail size
-        cols = 3  # Reduced columns for better visibility
-        
-        # Store references to prevent garbage collection
-        if not hasattr(self, 'stored_thumbs'):
-            self.stored_thumbs = []
-            
-        self.stored_thumbs.clear()
-        
-        for i, img in enumerate(self.combine_images):
-            thumb = img.resize((thumb_size, int(img.height * thumb_size / img.width)), Image.Resampling.LANCZOS)
-            tk_thumb = ImageTk.PhotoImage(thumb)
-            self.stored_thumbs.append(tk_thumb)  # Keep reference
-            
-            lbl = Label(grid_frame, image=tk_thumb, bg="#333")
-            lbl.grid(row=i // cols, column=i % cols, padx=5, pady=5)
-
-        grid_frame.update_idletasks()
-        self.stored_canvas.config(scrollregion=self.stored_canvas.bbox("all"))
-        
+        # Only the rows on screen get thumbnails and canvas items, built off the UI thread
+        if self.gallery is None:
+            self.gallery = VirtualGallery(self.canvas, len(self.session), self.stored_thumbnail,
+                                          thumb_size=300, cols=3)
+        else:
+            self.gallery.set_count(len(self.session))
+        self.gallery.pack()
+
         # Update info label
-        self.label_info.config(text=f"Stored Combinations: {len(self.combined_images)}")
+        self.info_label.config(text=f"Stored Combinations: {len(self.session)}")
+
+    def stored_thumbnail(self, index):
+        # Runs on a gallery thread: regenerated at thumbnail size from reduced decodes
+        top_path, bottom_path, _ = self.session[index]
+        w, h = display_size(top_path, bottom_path, 300, 300)
+        return render_pair_cached(self.image_cache, top_path, bottom_path, w, h, stimulus_thumbnail)
 
     # Navigation + Save
     def next_top(self):
@@ -260,8 +247,51 @@ class ImageCombinerApp:
                 self.current_combined.save(file_path)
                 messagebox.showinfo("Saved", f"Saved combined image to:\n{file_path}")
 
+    def save_stored(self):
+        if not len(self.session):
+            self.info_label.config(text="No stored combinations yet.")
+            return
+        folder = filedialog.askdirectory(title="Save Stored Combinations To")
+        if not folder:
+            return
+
+        # Same <top>__<bottom>.png naming as batch_render
+        top_names = dict(zip(self.folder1_images, output_names(self.folder1_images)))
+        bottom_names = dict(zip(self.folder2_images, output_names(self.folder2_images)))
+        was_idle = not self.save_queue.pending
+        for top_path, bottom_path, _ in self.session:
+            top_name = top_names.get(top_path) or os.path.splitext(os.path.basename(top_path))[0]
+            bottom_name = bottom_names.get(bottom_path) or os.path.splitext(os.path.basename(bottom_path))[0]
+            self.save_queue.submit(top_path, bottom_path, os.path.join(folder, pair_filename(top_name, bottom_name, "png")))
+        self.info_label.config(text=f"Saving {self.save_queue.pending} stored combinations to {folder}…")
+        if was_idle:
+            self.save_errors = []
+            self.root.after(100, self.poll_saves)
+
+    def poll_saves(self):
+        for file_path, error in self.save_queue.poll():
+            if error:
+                self.save_errors.append(f"{os.path.basename(file_path)}: {error}")
+        if self.save_queue.pending:
+            self.info_label.config(text=f"Saving stored combinations… {self.save_queue.pending} to go")
+            self.root.after(100, self.poll_saves)
+        elif self.save_errors:
+            self.info_label.config(text=f"Stored combinations saved, {len(self.save_errors)} failed — "
+                                        f"{self.save_errors[-1]}")
+        else:
+            self.info_label.config(text="Stored combinations saved")
+
+    def on_close(self):
+        # Let queued saves finish writing
+        self.save_queue.shutdown(wait=True)
+        self.root.destroy()
+
 
 if __name__ == "__main__":
+    clear_terminal()
+    # Confirm PIL
+    print(PIL.__version__)
+
     root = Tk()
     app = ImageCombinerApp(root)
     root.mainloop()
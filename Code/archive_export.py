@@ -0,0 +1,128 @@
+import io
+import os
+import zipfile
+import zlib
+from PIL.TiffImagePlugin import AppendingTiffWriter
+
+# Streaming containers for batch_render: pages are written one at a time as they
+# arrive, so memory does not grow with the number of pairs.
+
+ARCHIVE_KINDS = {".zip": "zip", ".tif": "tiff", ".tiff": "tiff", ".pdf": "pdf"}
+
+
+def archive_kind(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ARCHIVE_KINDS:
+        raise ValueError(f"Unsupported archive type '{ext}', use one of: {', '.join(sorted(ARCHIVE_KINDS))}")
+    return ARCHIVE_KINDS[ext]
+
+
+# --Page Encoders--
+# Run in the worker processes so the expensive compression happens in parallel
+def encode_png(image, compress_level=6):
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", compress_level=compress_level)
+    return buf.getvalue()
+
+
+def encode_pdf_page(image, compress_level=6):
+    # Grayscale pages are written as DeviceGray, a third of the data
+    if image.mode != "L":
+        image = image.convert("RGB")
+    colorspace = b"DeviceGray" if image.mode == "L" else b"DeviceRGB"
+    return image.width, image.height, colorspace, zlib.compress(image.tobytes(), compress_level)
+
+
+def encode_tiff_page(image, compress_level=6):
+    # The TIFF encoder needs the image itself; compression happens in the writer
+    return image
+
+
+# --Sinks--
+def check_overwrite(path, resume):
+    # TIFF and PDF cannot be appended to, so re-running an export would start the file over
+    if resume and os.path.exists(path):
+        raise FileExistsError(f"{path} already exists and cannot be resumed; pass --no-resume to overwrite it")
+
+
+class ZipSink:
+    def __init__(self, path, resume=True):
+        # PNGs are already compressed, storing them avoids paying deflate twice
+        mode = "a" if resume and os.path.exists(path) else "w"
+        self.zip = zipfile.ZipFile(path, mode, compression=zipfile.ZIP_STORED, allowZip64=True)
+        self.existing = set(self.zip.namelist())
+
+    def add(self, name, payload):
+        self.zip.writestr(name, payload)
+
+    def close(self):
+        self.zip.close()
+
+
+class TiffSink:
+    def __init__(self, path, resume=True):
+        check_overwrite(path, resume)
+        self.existing = set()
+        self.writer = AppendingTiffWriter(path, new=True)
+
+    def add(self, name, image):
+        image.save(self.writer, format="TIFF", compression="tiff_deflate")
+        self.writer.newFrame()
+
+    def close(self):
+        self.writer.close()
+
+
+class PdfSink:
+    # Minimal PDF writer: one Flate-compressed image per page, objects written as they come.
+    # Only byte offsets and page ids are kept; the page tree and xref go at the end.
+    def __init__(self, path, resume=True):
+        check_overwrite(path, resume)
+        self.existing = set()
+        self.fp = open(path, "wb")
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3  # 1 = catalog, 2 = page tree
+        self.fp.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    def _write_obj(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.fp.tell()
+        self.fp.write(b"%d 0 obj\n" % obj_id + body)
+        if stream is not None:
+            self.fp.write(b"\nstream\n" + stream + b"\nendstream")
+        self.fp.write(b"\nendobj\n")
+
+    def add(self, name, payload):
+        width, height, colorspace, data = payload
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+
+        self._write_obj(image_id, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                                  b"/ColorSpace /%s /BitsPerComponent 8 /Filter /FlateDecode "
+                                  b"/Length %d >>" % (width, height, colorspace, len(data)), data)
+        content = b"q %d 0 0 %d 0 0 cm /Im0 Do Q" % (width, height)
+        self._write_obj(content_id, b"<< /Length %d >>" % len(content), content)
+        self._write_obj(page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                                 b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                        % (width, height, image_id, content_id))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.page_ids)
+        self._write_obj(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self.page_ids))
+
+        xref_offset = self.fp.tell()
+        self.fp.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id)
+        for obj_id in range(1, self.next_id):
+            self.fp.write(b"%010d 00000 n \n" % self.offsets[obj_id])
+        self.fp.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, xref_offset))
+        self.fp.close()
+
+
+SINKS = {"zip": ZipSink, "tiff": TiffSink, "pdf": PdfSink}
+ENCODERS = {"zip": encode_png, "tiff": encode_tiff_page, "pdf": encode_pdf_page}
+
+
+def open_sink(path, resume=True):
+    return SINKS[archive_kind(path)](path, resume)
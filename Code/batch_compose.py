@@ -0,0 +1,95 @@
+from PIL import Image
+from combiner import pair_layout, probe_size
+# Without NumPy callers fall back to combine_full one pair at a time
+from optional_numpy import np
+
+# Distinct output shapes to keep buffers for (stimuli normally come in a few sizes)
+MAX_BUFFERS = 8
+
+
+# --Vectorised Compositing--
+# For a fixed top stimulus, every bottom that ends up with the same layout is composited in
+# one go: the top is broadcast into a preallocated (n, height, width, 3) buffer with a single
+# copy and the bottoms are stacked straight into the rest of it. Normalised stimuli (resized
+# to the shared width exactly like combine_full) are cached as arrays, so a top is resized
+# once per width and each bottom once per worker.
+class BatchCompositor:
+    def __init__(self, cache):
+        self.cache = cache
+        self._buffers = {}  # per-image shape -> uint8 array (capacity, height, width[, 3])
+
+    def normalized(self, path, width, height):
+        def load(p):
+            # Same resize as combine_full (default filter); grayscale stays a 2-D array,
+            # anything else is resized as RGBA and the alpha dropped afterwards
+            img = self.cache.load(p)
+            img = img.resize((width, height)) if img.mode == "L" else img.convert("RGBA").resize((width, height))
+            return np.asarray(img if img.mode == "L" else img.convert("RGB"))
+        return self.cache.load(path, variant=("normalized", width, height), loader=load)
+
+    def _buffer(self, n, height, width, channels):
+        # channels == 1 means a grayscale (n, height, width) buffer
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        buf = self._buffers.get(shape)
+        if buf is None or buf.shape[0] < n:
+            if len(self._buffers) >= MAX_BUFFERS:
+                self._buffers.clear()
+            buf = self._buffers[shape] = np.empty((n,) + shape, np.uint8)
+        return buf[:n]
+
+    def compose(self, top_path, bottom_paths):
+        # Yields (index into bottom_paths, combined "L"/"RGB" image or None, error or None)
+        try:
+            top_size = probe_size(top_path)
+        except Exception as e:
+            for i in range(len(bottom_paths)):
+                yield i, None, e
+            return
+
+        groups = {}
+        for i, path in enumerate(bottom_paths):
+            try:
+                layout = pair_layout(top_size, probe_size(path))
+            except Exception as e:
+                yield i, None, e
+                continue
+            groups.setdefault((layout.width, layout.top_height, layout.bottom_height), []).append(i)
+
+        for (width, top_h, bottom_h), members in groups.items():
+            try:
+                top = self.normalized(top_path, width, top_h)
+            except Exception as e:
+                for i in members:
+                    yield i, None, e
+                continue
+
+            # Pairs stay grayscale only when both stimuli are, like combine_full, so grayscale and
+            # colour bottoms are composited separately
+            by_channels = {}
+            for i in members:
+                try:
+                    bottom = self.normalized(bottom_paths[i], width, bottom_h)
+                except Exception as e:
+                    yield i, None, e
+                    continue
+                channels = 1 if top.ndim == 2 and bottom.ndim == 2 else 3
+                ready, bottoms = by_channels.setdefault(channels, ([], []))
+                ready.append(i)
+                bottoms.append(bottom)
+
+            for channels, (ready, bottoms) in by_channels.items():
+                yield from self._compose_group(top, bottoms, ready, top_h, bottom_h, width, channels)
+
+    def _compose_group(self, top, bottoms, ready, top_h, bottom_h, width, channels):
+        if channels == 3:
+            # Grayscale stimuli paired with colour ones are widened
+            top = top if top.ndim == 3 else np.repeat(top[..., None], 3, axis=2)
+            bottoms = [b if b.ndim == 3 else np.repeat(b[..., None], 3, axis=2) for b in bottoms]
+
+        out = self._buffer(len(ready), top_h + bottom_h, width, channels)
+        out[:, :top_h] = top
+        np.stack(bottoms, out=out[:, top_h:])
+        for k, i in enumerate(ready):
+            # Copied out of the buffer: "L" images would otherwise share its memory and be
+            # overwritten by the next compose call
+            yield i, Image.fromarray(out[k]).copy(), None
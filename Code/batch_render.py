@@ -0,0 +1,426 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from image_cache import ImageCache
+from combiner import LayoutPlan, combine_full, list_stimuli, unique_stimuli
+from dedup import DEFAULT_THRESHOLD
+from archive_export import ENCODERS, archive_kind, open_sink
+from contact_sheet import parse_dims, plan_sheets, render_sheet
+from batch_compose import BatchCompositor
+from optional_numpy import np
+
+# Headless renderer for every top x bottom pair, e.g.
+#   python batch_render.py TopFolder BottomFolder -o Combined --workers 32
+# Re-running the same command resumes: pairs already on disk are skipped.
+# With --archive out.zip / out.tif / out.pdf every pair is streamed into one file instead.
+# With --sheets 8x6 the pairs are laid out on labelled contact sheets (files or archive pages).
+
+# Each worker process keeps its own decode cache
+WORKER_CACHE_BYTES = 256 * 1024 * 1024
+# Bottoms per task; a task decodes its top stimulus once
+CHUNK_SIZE = 32
+# Archive pages travel back to the main process, so keep those tasks small
+ARCHIVE_CHUNK_SIZE = 4
+
+SAVE_FORMATS = {
+    "png": "PNG",
+    "jpg": "JPEG",
+}
+
+
+# --Naming--
+def output_names(paths):
+    # File stems; where two stimuli share a stem (a.png / a.jpg, or the same name in two
+    # subfolders) the path below the common folder is spelled out instead
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    counts = Counter(stems)
+    if len(paths) > 1 and len(counts) < len(paths):
+        root = os.path.commonpath(paths)
+        if root in paths:
+            root = os.path.dirname(root)
+    names = [stem if counts[stem] == 1 else os.path.relpath(p, root).replace(os.sep, "_").replace(".", "_")
+             for stem, p in zip(stems, paths)]
+
+    # Spelled-out paths can still meet another name (x.png and x_png.bmp both give x_png): later
+    # ones get a number, in path order so a resumed run names them the same way
+    taken = set(names)
+    seen = set()
+    for i, name in enumerate(names):
+        if name in seen:
+            n = 2
+            while f"{name}_{n}" in taken:
+                n += 1
+            names[i] = f"{name}_{n}"
+            taken.add(names[i])
+        seen.add(names[i])
+    return names
+
+
+def pair_filename(top_name, bottom_name, ext):
+    return f"{top_name}__{bottom_name}.{ext}"
+
+
+def plan_tasks(tops, bottoms, out_dir, ext, resume=True, plan=None):
+    existing = set(os.listdir(out_dir)) if resume else set()
+    top_names = output_names(tops)
+    bottom_names = output_names(bottoms)
+
+    # Largest outputs first so the pool does not end on one long straggler
+    order = range(len(tops))
+    if plan is not None:
+        order = sorted(order, key=plan.top_cost, reverse=True)
+
+    tasks = []
+    skipped = 0
+    for top, top_name in ((tops[i], top_names[i]) for i in order):
+        jobs = []
+        for bottom, bottom_name in zip(bottoms, bottom_names):
+            filename = pair_filename(top_name, bottom_name, ext)
+            if filename in existing:
+                skipped += 1
+                continue
+            jobs.append((bottom, os.path.join(out_dir, filename)))
+        for i in range(0, len(jobs), CHUNK_SIZE):
+            tasks.append((top, jobs[i:i + CHUNK_SIZE]))
+    return tasks, skipped
+
+
+# --Worker--
+_cache = None
+_compositor = None
+
+
+def init_worker(cache_bytes):
+    global _cache, _compositor
+    _cache = ImageCache(cache_bytes)
+    _compositor = BatchCompositor(_cache) if np is not None else None
+
+
+def save_atomic(image, out_path, fmt, params):
+    # Written under a temporary name so an interrupted run never leaves a file that resume would trust
+    tmp_path = out_path + ".part"
+    image.save(tmp_path, format=fmt, **params)
+    os.replace(tmp_path, out_path)
+
+
+def combined_pairs(top_path, bottom_paths):
+    # (index into bottom_paths, combined image or None, error or None) for one top, in any order
+    if _compositor is not None:
+        yield from _compositor.compose(top_path, bottom_paths)
+        return
+
+    try:
+        top = _cache.load(top_path)
+    except Exception as e:
+        for i in range(len(bottom_paths)):
+            yield i, None, e
+        return
+    for i, bottom_path in enumerate(bottom_paths):
+        try:
+            combined, error = combine_full(top, _cache.load(bottom_path)), None
+        except Exception as e:
+            combined, error = None, e
+        yield i, combined, error
+
+
+def render_chunk(top_path, jobs, fmt, params):
+    # Returns (rendered count, [(output path, error message)])
+    rendered = 0
+    failures = []
+    for i, combined, error in combined_pairs(top_path, [bottom for bottom, _ in jobs]):
+        bottom_path, out_path = jobs[i]
+        if error is None:
+            try:
+                save_atomic(combined, out_path, fmt, params)
+                rendered += 1
+                continue
+            except Exception as e:
+                error = e
+        failures.append((out_path, f"{os.path.basename(top_path)} + {bottom_path}: {error}"))
+    return rendered, failures
+
+
+def encode_chunk(top_path, jobs, kind, compress_level):
+    # Returns [(name, payload or None, error message or None)] in job order
+    encode = ENCODERS[kind]
+    results = [None] * len(jobs)
+    for i, combined, error in combined_pairs(top_path, [bottom for bottom, _ in jobs]):
+        bottom_path, name = jobs[i]
+        if error is None:
+            try:
+                results[i] = (name, encode(combined, compress_level), None)
+                continue
+            except Exception as e:
+                error = e
+        results[i] = (name, None, f"{os.path.basename(top_path)} + {bottom_path}: {error}")
+    return results
+
+
+def sheet_task(name, tops, bottoms, top_names, bottom_names, cell_size, out_dir, kind, compress_level):
+    # Saves the sheet into out_dir, or returns it encoded for an archive: (name, payload, error)
+    try:
+        sheet = render_sheet(_cache, tops, bottoms, top_names, bottom_names, *cell_size)
+        if out_dir:
+            save_atomic(sheet, os.path.join(out_dir, name), "PNG", {"compress_level": compress_level})
+            return name, None, None
+        return name, ENCODERS[kind](sheet, compress_level), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+def ordered_results(pool, fn, tasks, window, *args):
+    # Results in task order with at most `window` tasks in flight, so memory stays flat
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, *task, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# --Progress--
+class Progress:
+    def __init__(self, total, skipped=0, unit="pairs", stream=sys.stderr, interval=0.5):
+        self.total = total
+        self.unit = unit
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.stream = stream
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_report = 0
+
+    def update(self, done, failed=0):
+        self.done += done
+        self.failed += failed
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now):
+        elapsed = now - self.start
+        finished = self.done + self.failed
+        rate = finished / elapsed if elapsed > 0 else 0
+        eta = (self.total - finished) / rate if rate > 0 else 0
+        self.stream.write(f"\r{finished}/{self.total} {self.unit}  {rate:.1f}/s  ETA {eta:.0f}s  "
+                          f"(skipped {self.skipped}, failed {self.failed})   ")
+        self.stream.flush()
+
+    def finish(self):
+        self.report(time.perf_counter())
+        self.stream.write("\n")
+
+
+# --Entry Point--
+def dims_arg(spec):
+    # Checked while parsing, so a bad --sheets or --cell-size fails before any folder is indexed
+    try:
+        return parse_dims(spec)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected two positive numbers like 8x6, got '{spec}'")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Render every top x bottom stimulus pair without the UI.")
+    parser.add_argument("top_folder", help="folder of top line stimuli")
+    parser.add_argument("bottom_folder", help="folder of bottom line stimuli")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("-o", "--output", help="output directory, one file per pair")
+    target.add_argument("--archive", help="single .zip, .tif or .pdf file that every pair is streamed into")
+    parser.add_argument("--recursive", action="store_true", help="include stimuli in subfolders")
+    parser.add_argument("--dedupe", type=int, nargs="?", const=DEFAULT_THRESHOLD, metavar="BITS",
+                        help="skip near-duplicate stimuli whose perceptual hashes differ in at most BITS "
+                             f"of 256 bits (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--format", choices=sorted(SAVE_FORMATS), default="png")
+    parser.add_argument("--compress-level", type=int, default=6, help="PNG zlib level 0-9 (lower is faster)")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--sheets", type=dims_arg, metavar="COLSxROWS",
+                        help="write labelled contact sheets of COLS tops x ROWS bottoms instead of single pairs")
+    parser.add_argument("--cell-size", type=dims_arg, default="240x320", metavar="WxH", help="contact sheet cell size in pixels")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="re-render pairs that already exist (directories and .zip archives); "
+                             "needed to overwrite an existing .tif or .pdf archive")
+    return parser
+
+
+def save_params(args):
+    if args.format == "png":
+        return {"compress_level": args.compress_level}
+    return {"quality": args.quality}
+
+
+def load_unique(folder, recursive, threshold):
+    paths, duplicates = unique_stimuli(folder, recursive, threshold)
+    for duplicate, original in sorted(duplicates.items()):
+        print(f"Skipping duplicate stimulus: {duplicate} (same as {os.path.basename(original)})", file=sys.stderr)
+    return paths
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.dedupe is not None:
+        tops = load_unique(args.top_folder, args.recursive, args.dedupe)
+        bottoms = load_unique(args.bottom_folder, args.recursive, args.dedupe)
+    else:
+        tops = list_stimuli(args.top_folder, args.recursive)
+        bottoms = list_stimuli(args.bottom_folder, args.recursive)
+    if not tops or not bottoms:
+        print("Both folders must contain stimuli.", file=sys.stderr)
+        return 2
+
+    # Every layout comes from headers (usually the folder manifest), so unreadable stimuli
+    # are reported before any work starts
+    plan = LayoutPlan(tops, bottoms)
+    unreadable = set(plan.unreadable())
+    for path in sorted(unreadable):
+        print(f"Skipping unreadable stimulus: {path}", file=sys.stderr)
+    if unreadable:
+        tops = [p for p in tops if p not in unreadable]
+        bottoms = [p for p in bottoms if p not in unreadable]
+        plan = LayoutPlan(tops, bottoms)
+    if not tops or not bottoms:
+        return 1
+    largest = plan.max_combined_size()
+    print(f"Largest combined image: {largest[0]} x {largest[1]}", file=sys.stderr)
+
+    if args.sheets:
+        status = export_sheets(args, tops, bottoms)
+    elif args.archive:
+        status = export_archive(args, tops, bottoms)
+    else:
+        status = export_files(args, tops, bottoms, plan)
+    return status or (1 if unreadable else 0)
+
+
+def export_files(args, tops, bottoms, plan):
+    os.makedirs(args.output, exist_ok=True)
+    tasks, skipped = plan_tasks(tops, bottoms, args.output, args.format, resume=not args.no_resume, plan=plan)
+    pending = sum(len(jobs) for _, jobs in tasks)
+    print(f"{len(tops)} x {len(bottoms)} = {len(tops) * len(bottoms)} pairs, "
+          f"{skipped} already rendered, {pending} to go", file=sys.stderr)
+    if not tasks:
+        return 0
+
+    progress = Progress(pending, skipped)
+    failures = []
+    fmt, params = SAVE_FORMATS[args.format], save_params(args)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(WORKER_CACHE_BYTES,)) as pool:
+        futures = [pool.submit(render_chunk, top, jobs, fmt, params) for top, jobs in tasks]
+        for future in as_completed(futures):
+            rendered, failed = future.result()
+            failures.extend(failed)
+            progress.update(rendered, len(failed))
+    progress.finish()
+
+    for out_path, message in failures:
+        print(f"Failed {os.path.basename(out_path)}: {message}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def export_archive(args, tops, bottoms):
+    try:
+        kind = archive_kind(args.archive)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    try:
+        sink = open_sink(args.archive, resume=not args.no_resume)
+    except FileExistsError as e:
+        print(e, file=sys.stderr)
+        return 2
+    top_names = output_names(tops)
+    bottom_names = output_names(bottoms)
+    tasks = []
+    skipped = 0
+    for top, top_name in zip(tops, top_names):
+        jobs = []
+        for bottom, bottom_name in zip(bottoms, bottom_names):
+            name = pair_filename(top_name, bottom_name, "png")
+            if name in sink.existing:
+                skipped += 1
+                continue
+            jobs.append((bottom, name))
+        for i in range(0, len(jobs), ARCHIVE_CHUNK_SIZE):
+            tasks.append((top, jobs[i:i + ARCHIVE_CHUNK_SIZE]))
+
+    pending = sum(len(jobs) for _, jobs in tasks)
+    print(f"{len(tops)} x {len(bottoms)} = {len(tops) * len(bottoms)} pairs, "
+          f"{skipped} already in {os.path.basename(args.archive)}, {pending} to go", file=sys.stderr)
+
+    progress = Progress(pending, skipped)
+    failures = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(WORKER_CACHE_BYTES,)) as pool:
+            for results in ordered_results(pool, encode_chunk, tasks, 2 * args.workers,
+                                           kind, args.compress_level):
+                for name, payload, error in results:
+                    if error:
+                        failures.append((name, error))
+                    else:
+                        sink.add(name, payload)
+                progress.update(sum(1 for r in results if not r[2]), sum(1 for r in results if r[2]))
+    finally:
+        # Also on Ctrl+C, so a zip keeps a valid directory and can be resumed
+        sink.close()
+    progress.finish()
+
+    for name, message in failures:
+        print(f"Failed {name}: {message}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def export_sheets(args, tops, bottoms):
+    cols, rows = args.sheets
+    cell_size = args.cell_size
+    if args.archive:
+        try:
+            kind = archive_kind(args.archive)
+            sink = open_sink(args.archive, resume=not args.no_resume)
+        except (ValueError, FileExistsError) as e:
+            print(e, file=sys.stderr)
+            return 2
+        existing, out_dir = sink.existing, None
+    else:
+        sink, kind, out_dir = None, None, args.output
+        os.makedirs(out_dir, exist_ok=True)
+        existing = set(os.listdir(out_dir)) if not args.no_resume else set()
+
+    sheets = plan_sheets(tops, bottoms, output_names(tops), output_names(bottoms), cols, rows, "png")
+    tasks = [sheet for sheet in sheets if sheet[0] not in existing]
+    print(f"{len(sheets)} sheets of {cols} x {rows} pairs, {len(sheets) - len(tasks)} already written, "
+          f"{len(tasks)} to go", file=sys.stderr)
+
+    progress = Progress(len(tasks), len(sheets) - len(tasks), unit="sheets")
+    failures = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(WORKER_CACHE_BYTES,)) as pool:
+            for name, payload, error in ordered_results(pool, sheet_task, tasks, 2 * args.workers,
+                                                        cell_size, out_dir, kind, args.compress_level):
+                if error:
+                    failures.append((name, error))
+                elif sink:
+                    sink.add(name, payload)
+                progress.update(0 if error else 1, 1 if error else 0)
+    finally:
+        if sink:
+            sink.close()
+    progress.finish()
+
+    for name, message in failures:
+        print(f"Failed {name}: {message}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
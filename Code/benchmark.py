@@ -0,0 +1,227 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+import PIL
+from PIL import Image, ImageDraw
+from image_cache import ImageCache
+from combiner import fit_size, list_stimuli, stimulus_thumbnail
+from contact_sheet import parse_dims
+from grid_renderer import GridRenderer, grid_pairs
+from optional_numpy import np
+import Combine_Final
+import Combine_Test
+
+# Headless timings of the decode / composite / display / save paths on synthetic stimuli, e.g.
+#   python benchmark.py --sizes 1200x900,2400x1800 --counts 20,100 -o bench.json
+#   python benchmark.py --sizes 1200x900 --counts 20 --compare bench.json
+# The UI methods of Combine_Final and Combine_Test are called on a stand-in for the app, so
+# both versions are measured through their own code without opening a window.
+
+VIEW_SIZE = (1000, 640)  # canvas of the default 1000x700 window
+GRID = 3  # cells per side, like the grid view
+
+
+# --Synthetic Stimuli--
+def make_stimulus(width, height, seed, color=False):
+    # A few thick random strokes on white, like the line stimuli
+    rng = random.Random(seed)
+    img = Image.new("RGB" if color else "L", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    stroke = max(2, width // 150)
+    for _ in range(rng.randint(3, 7)):
+        points = [(rng.randrange(width), rng.randrange(height)) for _ in range(rng.randint(2, 5))]
+        fill = (rng.randrange(200), rng.randrange(200), rng.randrange(200)) if color else 0
+        draw.line(points, fill=fill, width=stroke, joint="curve")
+    return img
+
+
+def make_folder(folder, count, size, seed, fmt="png", color=False):
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        # Heights vary a little so pairs do not all share one layout
+        height = size[1] + (i % 3) * size[1] // 10
+        image = make_stimulus(size[0], height, seed * 100003 + i, color)
+        image.save(os.path.join(folder, f"stim_{i:04d}.{fmt}"), quality=95)
+
+
+# --Timing--
+def summarize(times):
+    times = sorted(times)
+    return {"n": len(times),
+            "min_ms": round(times[0] * 1000, 3),
+            "median_ms": round(statistics.median(times) * 1000, 3),
+            "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 3),
+            "mean_ms": round(statistics.fmean(times) * 1000, 3)}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def app_stub(cache):
+    # Just the attributes the benchmarked methods read
+    return SimpleNamespace(image_cache=cache, view_size=VIEW_SIZE)
+
+
+def test_show(image, box_w, box_h):
+    # The resize Combine_Test.show_image does before handing the frame to Tk
+    return image.resize(fit_size(image.width, image.height, box_w, box_h), Image.Resampling.LANCZOS)
+
+
+def run_cases(tops, bottoms, pairs, cache_bytes):
+    # Every case starts from a fresh cache; "warm" cases repeat the work on the cache just filled
+    results = {}
+    cell_w, cell_h = VIEW_SIZE[0] // GRID, VIEW_SIZE[1] // GRID
+    stimuli = tops + bottoms
+
+    cache = ImageCache(cache_bytes)
+    results["decode_cold"] = [timed(cache.load, p) for p in stimuli]
+    results["decode_warm"] = [timed(cache.load, p) for p in stimuli]
+
+    for version, module in (("final", Combine_Final), ("test", Combine_Test)):
+        app = app_stub(ImageCache(cache_bytes))
+        if version == "final":
+            single = lambda t, b: module.ImageCombinerApp.render_pair(app, t, b)
+        else:
+            single = lambda t, b: test_show(module.ImageCombinerApp.combine_images(app, t, b), *VIEW_SIZE)
+        results[f"{version}_single_cold"] = [timed(single, t, b) for t, b in pairs]
+        results[f"{version}_single_warm"] = [timed(single, t, b) for t, b in pairs]
+
+        app = app_stub(ImageCache(cache_bytes))
+        if version == "final":
+            renderer = GridRenderer(app.image_cache)
+            grid = lambda t, b: renderer.render(grid_pairs(tops, bottoms, t, b, GRID, GRID), cell_w, cell_h)
+        else:
+            def grid(t, b):
+                for _, _, top, bottom in grid_pairs(tops, bottoms, t, b, GRID, GRID):
+                    combined = module.ImageCombinerApp.combine_images(app, top, bottom)
+                    combined.resize((cell_w, cell_h), Image.Resampling.LANCZOS)
+        # One grid step per top, moving right like the arrow keys
+        steps = [(t, 0) for t in range(len(tops))]
+        results[f"{version}_grid_cold"] = [timed(grid, t, b) for t, b in steps]
+        results[f"{version}_grid_warm"] = [timed(grid, t, b) for t, b in steps]
+        if version == "final":
+            renderer.shutdown()
+
+    cache = ImageCache(cache_bytes)
+    results["thumbnail_cold"] = [timed(stimulus_thumbnail, cache, p, cell_w, cell_h // 2) for p in stimuli]
+
+    app = app_stub(ImageCache(cache_bytes))
+    combined = [Combine_Final.ImageCombinerApp.render_full(app, t, b) for t, b in pairs]
+    results["composite_full"] = [timed(Combine_Final.ImageCombinerApp.render_full, app, t, b) for t, b in pairs]
+    for level in (1, 6):
+        results[f"encode_png{level}"] = [timed(lambda im: im.save(io.BytesIO(), format="PNG", compress_level=level), im)
+                                         for im in combined]
+    results["encode_jpg95"] = [timed(lambda im: im.convert("RGB").save(io.BytesIO(), format="JPEG", quality=95), im)
+                               for im in combined]
+    return results
+
+
+def run(args):
+    sizes = [parse_dims(s) for s in args.sizes.split(",")]
+    counts = [int(c) for c in args.counts.split(",")]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="matchprogram_bench_")
+    report = {"meta": {"python": platform.python_version(), "pillow": PIL.__version__,
+                       "numpy": np.__version__ if np is not None else None,
+                       "platform": platform.platform(), "cpus": os.cpu_count(),
+                       "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)},
+              "results": []}
+    try:
+        for size in sizes:
+            for count in counts:
+                folder = os.path.join(workdir, f"{size[0]}x{size[1]}_{count}_{args.format}")
+                top_dir, bottom_dir = os.path.join(folder, "top"), os.path.join(folder, "bottom")
+                if not os.path.isdir(folder):
+                    make_folder(top_dir, count, size, 1, args.format, args.color)
+                    make_folder(bottom_dir, count, size, 2, args.format, args.color)
+
+                for manifest in (os.path.join(top_dir, ".matchprogram_manifest.json"),
+                                 os.path.join(bottom_dir, ".matchprogram_manifest.json")):
+                    if os.path.exists(manifest):
+                        os.remove(manifest)
+                index_cold = timed(list_stimuli, top_dir)
+                tops = list_stimuli(top_dir)
+                index_warm = timed(list_stimuli, top_dir)
+                bottoms = list_stimuli(bottom_dir)
+
+                # Diagonal walk so every stimulus is used once as top and once as bottom
+                pairs = [(tops[i], bottoms[(i * 7) % count]) for i in range(count)][:args.pairs]
+                for _ in range(args.repeat):
+                    cases = run_cases(tops, bottoms, pairs, args.cache_mb * 1024 * 1024)
+                    cases["index_cold"] = [index_cold]
+                    cases["index_warm"] = [index_warm]
+                    for case, times in sorted(cases.items()):
+                        report["results"].append({"case": case, "size": f"{size[0]}x{size[1]}",
+                                                  "count": count, "times": times})
+                print(f"{size[0]}x{size[1]} x {count} done", file=sys.stderr)
+    finally:
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # Repeats are pooled per (case, size, count)
+    pooled = {}
+    for row in report["results"]:
+        pooled.setdefault((row["case"], row["size"], row["count"]), []).extend(row.pop("times"))
+    report["results"] = [dict(case=case, size=size, count=count, **summarize(times))
+                         for (case, size, count), times in pooled.items()]
+    return report
+
+
+# --Reporting--
+def print_table(report, baseline=None):
+    base = {}
+    if baseline:
+        base = {(r["case"], r["size"], r["count"]): r["median_ms"] for r in baseline["results"]}
+    header = f"{'case':<22}{'size':>11}{'count':>7}{'median ms':>12}{'p95 ms':>10}"
+    print(header + (f"{'baseline':>11}{'ratio':>8}" if baseline else ""))
+    for r in report["results"]:
+        line = f"{r['case']:<22}{r['size']:>11}{r['count']:>7}{r['median_ms']:>12.2f}{r['p95_ms']:>10.2f}"
+        old = base.get((r["case"], r["size"], r["count"]))
+        if old:
+            line += f"{old:>11.2f}{r['median_ms'] / old:>8.2f}"
+        print(line)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the combine/display/save paths on synthetic stimuli.")
+    parser.add_argument("--sizes", default="1200x900", help="comma separated stimulus sizes, e.g. 800x600,2400x1800")
+    parser.add_argument("--counts", default="20", help="comma separated stimuli per folder, e.g. 20,200")
+    parser.add_argument("--pairs", type=int, default=20, help="pairs timed per single-view case")
+    parser.add_argument("--repeat", type=int, default=1, help="repeat every case, pooling the timings")
+    parser.add_argument("--format", choices=["png", "jpg"], default="png", help="stimulus file format")
+    parser.add_argument("--color", action="store_true", help="coloured strokes instead of black on white")
+    parser.add_argument("--cache-mb", type=int, default=512, help="decoded-image cache budget")
+    parser.add_argument("--workdir", help="keep generated stimuli here and reuse them between runs")
+    parser.add_argument("--keep", action="store_true", help="do not delete the temporary stimuli")
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier run to show median ratios against")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report = run(args)
+    print_table(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
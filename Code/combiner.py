@@ -0,0 +1,278 @@
+import os
+from collections import namedtuple
+from functools import lru_cache
+from PIL import Image
+from image_cache import COMPACT_STIMULI, as_grayscale, file_key
+from stimulus_index import index_folder
+from dedup import DEFAULT_THRESHOLD, find_duplicates, keep_order
+from latency_trace import phase
+
+# Tk-free layout and rendering shared by the UI views and the batch renderer
+
+# Dimensions already read from a folder manifest, keyed like the image cache (path, mtime, size)
+_known_sizes = {}
+
+
+def list_stimuli(folder, recursive=False):
+    index = index_folder(folder, recursive)
+    remember_sizes(index)
+    return index.paths
+
+
+def unique_stimuli(folder, recursive=False, threshold=DEFAULT_THRESHOLD, progress=None):
+    # Like list_stimuli, minus perceptual duplicates; returns (paths, {duplicate: path kept}).
+    # Hashes are cached in the folder manifest, so only new or changed stimuli are decoded;
+    # progress(done, total) follows the hashing.
+    index = index_folder(folder, recursive)
+    remember_sizes(index)
+    sizes = {os.path.join(index.folder, rel): (entry["width"], entry["height"])
+             for rel, entry in index.entries.items() if entry.get("width")}
+    hashes = index.perceptual_hashes(progress=progress)
+    duplicates = find_duplicates(keep_order(index.paths, sizes), hashes, threshold)
+    return [p for p in index.paths if p not in duplicates], duplicates
+
+
+def remember_sizes(index):
+    for path in index.paths:
+        entry = index.entry(path)
+        if entry.get("width"):
+            _known_sizes[(path, entry["mtime_ns"], entry["size"])] = (entry["width"], entry["height"])
+
+
+# --Layout--
+def combined_layout(size1, size2):
+    # Same rule as combine_full: both stimuli scaled to the narrower width, stacked
+    width = min(size1[0], size2[0])
+    h1 = int(size1[1] * width / size1[0])
+    h2 = int(size2[1] * width / size2[0])
+    return width, h1, h2
+
+
+PairLayout = namedtuple("PairLayout", "width top_height bottom_height top_scale bottom_scale")
+
+
+def pair_layout(size1, size2):
+    width, h1, h2 = combined_layout(size1, size2)
+    return PairLayout(width, h1, h2, width / size1[0], width / size2[0])
+
+
+def fit_size(width, height, box_w, box_h):
+    # Largest size with the same aspect ratio that fits in the box
+    if width / height > box_w / box_h:
+        return box_w, max(1, int(box_w * height / width))
+    return max(1, int(box_h * width / height)), box_h
+
+
+@lru_cache(maxsize=8192)
+def _probe(key):
+    with Image.open(key[0]) as img:
+        return img.size
+
+
+def probe_size(path):
+    # From the folder manifest when possible, otherwise header only, no pixel decode
+    key = file_key(path)
+    return _known_sizes.get(key) or _probe(key)
+
+
+# --Layout Planning--
+class LayoutPlan:
+    # Combined size and scale factors for every top x bottom pair, from header dimensions only
+    # (normally straight from the folder manifest), so work can be sized and scheduled before
+    # anything is decoded.
+    def __init__(self, top_paths, bottom_paths):
+        self.top_paths = top_paths
+        self.bottom_paths = bottom_paths
+        self.top_sizes = [self._size(p) for p in top_paths]
+        self.bottom_sizes = [self._size(p) for p in bottom_paths]
+        # Stimuli usually share a handful of sizes, so layouts are computed per distinct size pair
+        self._layouts = {}
+
+    def _size(self, path):
+        try:
+            return probe_size(path)
+        except Exception:
+            return None
+
+    def unreadable(self):
+        return ([p for p, size in zip(self.top_paths, self.top_sizes) if size is None] +
+                [p for p, size in zip(self.bottom_paths, self.bottom_sizes) if size is None])
+
+    def layout(self, top_idx, bottom_idx):
+        # None when either header could not be read
+        key = (self.top_sizes[top_idx], self.bottom_sizes[bottom_idx])
+        layout = self._layouts.get(key)
+        if layout is None and None not in key:
+            layout = self._layouts[key] = pair_layout(*key)
+        return layout
+
+    def top_cost(self, top_idx):
+        # Output pixels for one top against every bottom
+        total = 0
+        for b in range(len(self.bottom_paths)):
+            layout = self.layout(top_idx, b)
+            if layout:
+                total += layout.width * (layout.top_height + layout.bottom_height)
+        return total
+
+    def max_combined_size(self):
+        sizes = [(l.width, l.top_height + l.bottom_height) for l in self._all_layouts()]
+        return (max(w for w, _ in sizes), max(h for _, h in sizes)) if sizes else None
+
+    def _all_layouts(self):
+        for t in set(self.top_sizes) - {None}:
+            for b in set(self.bottom_sizes) - {None}:
+                yield pair_layout(t, b)
+
+
+# --Full Resolution--
+def combine_full(img1, img2):
+    # Two grayscale stimuli stay grayscale; anything else is composited as RGBA like before
+    mode = "L" if img1.mode == img2.mode == "L" else "RGBA"
+    if mode == "RGBA":
+        img1, img2 = img1.convert("RGBA"), img2.convert("RGBA")
+
+    # Resize to same width
+    width, h1, h2 = combined_layout(img1.size, img2.size)
+    img1 = img1.resize((width, h1))
+    img2 = img2.resize((width, h2))
+
+    combined = Image.new(mode, (width, h1 + h2))
+    combined.paste(img1, (0, 0))
+    combined.paste(img2, (0, h1))
+    return combined if mode == "L" else combined.convert("RGB")
+
+
+# --Reduced Decoding--
+def reduction_factor(src_size, target_size):
+    # Largest power of two that keeps the decode at least as big as the target.
+    # Quantising to powers of two lets neighbouring pairs share one cached decode.
+    factor = 1
+    while src_size[0] >= target_size[0] * factor * 2 and src_size[1] >= target_size[1] * factor * 2:
+        factor *= 2
+    return factor
+
+
+def decode_reduced(path, factor):
+    with phase("open"):
+        img = Image.open(path)
+        full_w = img.width
+        if factor > 1:
+            # JPEG can decode straight at 1/2, 1/4 or 1/8 scale; a no-op for other formats
+            img.draft("RGB", (img.width // factor, img.height // factor))
+    with img:
+        # draft rounds the reduced size up, so an odd width would floor to one scale too few
+        remaining = max(1, factor // max(1, round(full_w / img.width)))
+        with phase("decode"):
+            img = img.convert("L") if img.mode in ("1", "L") else img.convert("RGB")
+    with phase("convert"):
+        if COMPACT_STIMULI and img.mode == "RGB":
+            img = as_grayscale(img) or img
+
+    # Whatever draft could not do is finished by box-averaging
+    if remaining > 1:
+        with phase("reduce"):
+            img = img.reduce(remaining)
+    return img
+
+
+def scaled_stimulus(cache, path, width, height, resample=Image.Resampling.LANCZOS):
+    factor = reduction_factor(probe_size(path), (width, height))
+    base = cache.load(path, variant=("reduced", factor), loader=lambda p: decode_reduced(p, factor))
+    if base.size == (width, height):
+        return base
+    with phase("resize"):
+        return base.resize((width, height), resample)
+
+
+def preview_stimulus(cache, path, width, height):
+    # First pass of progressive rendering: the same cached reduced decode, bilinear instead of LANCZOS
+    return scaled_stimulus(cache, path, width, height, Image.Resampling.BILINEAR)
+
+
+def stimulus_thumbnail(cache, path, width, height, store=None):
+    # Small enough to keep: grid cells that share a stimulus reuse its thumbnail.
+    # With a ThumbnailStore they also survive the session and are shared between instances.
+    def load(p):
+        thumb = store and store.get(p, width, height)
+        if thumb is None:
+            thumb = scaled_stimulus(cache, p, width, height)
+            if store:
+                store.put(p, width, height, thumb)
+        return thumb
+    return cache.load(path, variant=("thumb", width, height), loader=load)
+
+
+def strip_height(path, width):
+    src_w, src_h = probe_size(path)
+    return max(1, round(src_h * width / src_w))
+
+
+def stimulus_strip(cache, path, width, store=None):
+    # Thumbnail at a given width and the stimulus' own aspect ratio: it does not depend on the
+    # stimulus it is paired with, so every cell in a grid column or row shares it
+    return stimulus_thumbnail(cache, path, width, strip_height(path, width), store)
+
+
+def cached_strip(cache, path, width, store=None):
+    # The strip if it is already in memory or in the store, without decoding the stimulus; else None
+    height = strip_height(path, width)
+    variant = ("thumb", width, height)
+    strip = cache.get(file_key(path) + (variant,))
+    if strip is None and store:
+        strip = store.get(path, width, height)
+        if strip is not None:
+            strip = cache.put(file_key(path) + (variant,), strip)
+    return strip
+
+
+def stack_strips(top, bottom, out_w, out_h):
+    # Same layout as combine_full at thumbnail scale, then fitted to the cell
+    stacked = Image.new("L" if top.mode == bottom.mode == "L" else "RGB", (top.width, top.height + bottom.height))
+    stacked.paste(top, (0, 0))
+    stacked.paste(bottom, (0, top.height))
+    if stacked.size == (out_w, out_h):
+        return stacked
+    with phase("resize"):
+        return stacked.resize((out_w, out_h), Image.Resampling.LANCZOS)
+
+
+# --Display Rendering--
+def display_size(path1, path2, box_w, box_h):
+    width, h1, h2 = combined_layout(probe_size(path1), probe_size(path2))
+    return fit_size(width, h1 + h2, box_w, box_h)
+
+
+def render_pair(cache, path1, path2, out_w, out_h, scale=scaled_stimulus):
+    # Composite drawn directly at the output size: each half is decoded reduced and
+    # resized straight to its share of the frame, the full-resolution image is never built
+    width, h1, h2 = combined_layout(probe_size(path1), probe_size(path2))
+    top_h = min(out_h - 1, max(1, round(out_h * h1 / (h1 + h2))))
+    bottom_h = out_h - top_h
+
+    top = scale(cache, path1, out_w, top_h)
+    bottom = scale(cache, path2, out_w, bottom_h)
+    # Grayscale until it reaches Tk; paste converts a grayscale half into an RGB frame
+    with phase("paste"):
+        combined = Image.new("L" if top.mode == bottom.mode == "L" else "RGB", (out_w, out_h))
+        combined.paste(top, (0, 0))
+        combined.paste(bottom, (0, top_h))
+    return combined
+
+
+def for_display(image):
+    # Stimuli stay grayscale through caching and compositing; Tk gets RGB
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def frame_key(path1, path2, out_w, out_h):
+    return (file_key(path1), file_key(path2), "frame", out_w, out_h)
+
+
+def render_pair_cached(cache, path1, path2, out_w, out_h, scale=scaled_stimulus):
+    # Finished frames are cached too, so a prefetched pair costs nothing to show
+    key = frame_key(path1, path2, out_w, out_h)
+    frame = cache.get(key)
+    if frame is None:
+        frame = cache.put(key, render_pair(cache, path1, path2, out_w, out_h, scale))
+    return frame
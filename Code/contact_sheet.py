@@ -0,0 +1,70 @@
+from PIL import Image, ImageDraw, ImageFont
+from combiner import display_size, render_pair, stimulus_thumbnail
+
+# Contact sheets: the permutation matrix cut into tiles of cols x rows pairs, laid out like
+# the grid view (tops across, bottoms down). Each sheet is built and written on its own,
+# so the full atlas never has to exist in memory.
+
+BACKGROUND = (34, 34, 34)  # same as the app canvas (#222)
+LABEL_COLOR = (220, 220, 220)
+ERROR_COLOR = (230, 90, 90)
+LABEL_HEIGHT = 30
+PADDING = 4
+
+
+def parse_dims(spec):
+    # "8x6" -> (8, 6); ValueError unless both are positive whole numbers
+    cols, _, rows = spec.lower().partition("x")
+    cols, rows = int(cols), int(rows)
+    if cols < 1 or rows < 1:
+        raise ValueError(f"{spec} must be two positive numbers")
+    return cols, rows
+
+
+def sheet_filename(sheet_row, sheet_col, ext):
+    # Tile position in the full atlas: row = block of bottoms, col = block of tops
+    return f"sheet_r{sheet_row:03d}_c{sheet_col:03d}.{ext}"
+
+
+def plan_sheets(tops, bottoms, top_names, bottom_names, cols, rows, ext):
+    sheets = []
+    for sheet_row, j in enumerate(range(0, len(bottoms), rows)):
+        for sheet_col, i in enumerate(range(0, len(tops), cols)):
+            sheets.append((sheet_filename(sheet_row, sheet_col, ext),
+                           tops[i:i + cols], bottoms[j:j + rows],
+                           top_names[i:i + cols], bottom_names[j:j + rows]))
+    return sheets
+
+
+def fit_text(draw, text, font, width):
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def render_sheet(cache, tops, bottoms, top_names, bottom_names, cell_w, cell_h):
+    # Sheets are sized by the pairs they hold, so the last row/column of the atlas is not padded
+    pitch_h = cell_h + LABEL_HEIGHT
+    sheet = Image.new("RGB", (len(tops) * cell_w, len(bottoms) * pitch_h), BACKGROUND)
+    draw = ImageDraw.Draw(sheet)
+    font = ImageFont.load_default()
+    inner_w, inner_h = cell_w - 2 * PADDING, cell_h - 2 * PADDING
+
+    for r, (bottom, bottom_name) in enumerate(zip(bottoms, bottom_names)):
+        for c, (top, top_name) in enumerate(zip(tops, top_names)):
+            x, y = c * cell_w, r * pitch_h
+            try:
+                w, h = display_size(top, bottom, inner_w, inner_h)
+                # Per-stimulus thumbnails are shared by every cell on the sheet using that stimulus
+                cell = render_pair(cache, top, bottom, w, h, stimulus_thumbnail)
+                sheet.paste(cell, (x + (cell_w - w) // 2, y + (cell_h - h) // 2))
+            except Exception as e:
+                draw.text((x + PADDING, y + PADDING), fit_text(draw, f"Error: {e}", font, inner_w),
+                          fill=ERROR_COLOR, font=font)
+            draw.text((x + PADDING, y + cell_h), fit_text(draw, f"T: {top_name}", font, inner_w),
+                      fill=LABEL_COLOR, font=font)
+            draw.text((x + PADDING, y + cell_h + LABEL_HEIGHT // 2), fit_text(draw, f"B: {bottom_name}", font, inner_w),
+                      fill=LABEL_COLOR, font=font)
+    return sheet
@@ -0,0 +1,79 @@
+from PIL import Image
+from image_cache import on_white
+
+# Perceptual hashes for spotting re-exported or re-encoded copies of the same stimulus.
+# A 16x16 difference hash over box-averaged ink: line drawings are mostly white, so the
+# usual 8x8 hash leaves too few bits that depend on the drawing itself.
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Stimuli whose hashes differ in at most this many of the 256 bits count as duplicates
+DEFAULT_THRESHOLD = 8
+
+# Of a group of duplicates a lossless file is kept over a re-encoded one
+LOSSY_EXTS = (".jpg", ".jpeg")
+
+
+def perceptual_hash(path):
+    with Image.open(path) as img:
+        # JPEG decodes straight at a fraction of the size; the hash only needs 17x16 pixels
+        img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        small = on_white(img).convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        start = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[start + col] > pixels[start + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def band_keys(value, bands):
+    # The hash cut into equal runs of bits. Two hashes at most bands - 1 bits apart agree
+    # exactly on at least one run, so only hashes sharing a run need comparing.
+    width = -(-HASH_BITS // bands)
+    mask = (1 << width) - 1
+    return [(band, (value >> (band * width)) & mask) for band in range(bands)]
+
+
+def keep_order(paths, sizes):
+    # paths with the best copy to keep first: lossless before lossy, then the most pixels;
+    # sizes is {path: (width, height)}, ties keep the order given
+    def rank(path):
+        width, height = sizes.get(path) or (0, 0)
+        return path.lower().endswith(LOSSY_EXTS), -width * height
+    return sorted(paths, key=rank)
+
+
+def find_duplicates(paths, hashes, threshold=DEFAULT_THRESHOLD):
+    # {duplicate path: path it duplicates}. The first path (in the order given) of each group is
+    # kept; stimuli without a hash (unreadable) are never treated as duplicates.
+    duplicates = {}
+    kept = []  # (hash, path) of every path kept, in order
+    exact = {}  # hash -> its position in kept
+    buckets = {}  # band key -> positions in kept
+    bands = min(threshold + 1, HASH_BITS)
+    for path in paths:
+        value = hashes.get(path)
+        if value is None:
+            continue
+        pos = exact.get(value)
+        keys = band_keys(value, bands)
+        if pos is None and threshold > 0:
+            if threshold >= HASH_BITS:
+                candidates = range(len(kept))
+            else:
+                candidates = sorted({i for key in keys for i in buckets.get(key, ())})
+            pos = next((i for i in candidates if hamming(kept[i][0], value) <= threshold), None)
+        if pos is None:
+            exact[value] = len(kept)
+            for key in keys:
+                buckets.setdefault(key, []).append(len(kept))
+            kept.append((value, path))
+        else:
+            duplicates[path] = kept[pos][1]
+    return duplicates
@@ -0,0 +1,87 @@
+from PIL import Image, ImageTk
+
+# Same as the canvas background (#222)
+BACKGROUND = (34, 34, 34)
+
+
+# --Canvas Presentation--
+# Keeps one canvas image item and PhotoImage for the single view and one per grid cell, and
+# updates their pixels in place with PhotoImage.paste. Nothing on the Tk side is allocated per
+# frame: PhotoImages are only rebuilt when the canvas (or cell) size changes.
+class FramePresenter:
+    def __init__(self, canvas, bg=BACKGROUND):
+        self.canvas = canvas
+        self.bg = bg
+        self.view_item = None
+        self.view_photo = None
+        self.view_backing = None  # canvas-sized RGB image frames are centred on
+        self.view_source = None  # last frame pasted, so an unchanged frame is not pasted again
+        self.cell_items = {}  # (row, col) -> canvas item
+        self.cell_photos = {}  # (row, col) -> PhotoImage of the current cell size
+        self.cell_sources = {}  # (row, col) -> last image pasted into the cell
+        self.cell_size = None
+
+    # Single view
+    def show_frame(self, image, canvas_w, canvas_h):
+        self.hide_cells()
+        if self.view_photo is None or self.view_backing.size != (canvas_w, canvas_h):
+            self.view_backing = Image.new("RGB", (canvas_w, canvas_h), self.bg)
+            self.view_photo = ImageTk.PhotoImage("RGB", (canvas_w, canvas_h))
+            self.view_source = None
+            if self.view_item is None:
+                self.view_item = self.canvas.create_image(0, 0, anchor="nw")
+            self.canvas.itemconfigure(self.view_item, image=self.view_photo)
+
+        if image is not self.view_source:
+            self.view_backing.paste(self.bg, (0, 0, canvas_w, canvas_h))
+            # paste converts grayscale frames to the backing's RGB
+            self.view_backing.paste(image, ((canvas_w - image.width) // 2, (canvas_h - image.height) // 2))
+            self.view_photo.paste(self.view_backing)
+            self.view_source = image
+        self.canvas.itemconfigure(self.view_item, state="normal")
+
+    def hide_frame(self):
+        if self.view_item is not None:
+            self.canvas.itemconfigure(self.view_item, state="hidden")
+
+    # Grid view
+    def show_cells(self, cells, cell_w, cell_h):
+        # cells: [(row, col, image or None)]; an image must be exactly cell_w x cell_h
+        self.hide_frame()
+        if self.cell_size != (cell_w, cell_h):
+            self.cell_photos.clear()
+            self.cell_sources.clear()
+            self.cell_size = (cell_w, cell_h)
+
+        shown = set()
+        for r, c, image in cells:
+            slot = (r, c)
+            if image is None:
+                continue
+            shown.add(slot)
+            item = self.cell_items.get(slot)
+            if item is None:
+                item = self.cell_items[slot] = self.canvas.create_image(c * cell_w, r * cell_h, anchor="nw")
+            photo = self.cell_photos.get(slot)
+            if photo is None:
+                photo = self.cell_photos[slot] = ImageTk.PhotoImage("RGB", (cell_w, cell_h))
+                self.canvas.coords(item, c * cell_w, r * cell_h)
+                self.canvas.itemconfigure(item, image=photo)
+                self.cell_sources.pop(slot, None)
+            # Cached cells come back as the same object, so cells that did not change are skipped
+            if self.cell_sources.get(slot) is not image:
+                photo.paste(image)
+                self.cell_sources[slot] = image
+            self.canvas.itemconfigure(item, state="normal")
+
+        for slot, item in self.cell_items.items():
+            if slot not in shown:
+                self.canvas.itemconfigure(item, state="hidden")
+
+    def hide_cells(self):
+        for item in self.cell_items.values():
+            self.canvas.itemconfigure(item, state="hidden")
+
+    def clear(self):
+        self.hide_frame()
+        self.hide_cells()
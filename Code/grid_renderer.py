@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from combiner import cached_strip, frame_key, preview_stimulus, stack_strips, stimulus_strip, strip_height
+
+# Largest grid the views offer (columns and rows)
+MAX_GRID = 12
+
+
+def grid_pairs(top_paths, bottom_paths, top_idx, bottom_idx, cols, rows):
+    # (row, col, top path, bottom path) for every visible cell, tops across and bottoms down
+    return [(r, c,
+             top_paths[(top_idx + c) % len(top_paths)],
+             bottom_paths[(bottom_idx + r) % len(bottom_paths)])
+            for r in range(rows) for c in range(cols)]
+
+
+# --Grid Cell Rendering--
+class GridRenderer:
+    def __init__(self, cache, workers=None, store=None):
+        self.cache = cache
+        # Optional ThumbnailStore: per-stimulus thumbnails persist on disk between sessions
+        self.store = store
+        # Pillow releases the GIL while decoding and resampling, so threads scale here
+        workers = workers or min(8, os.cpu_count() or 2)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grid")
+
+    def render_cell(self, top_path, bottom_path, cell_w, cell_h):
+        # Cells are stacked from per-stimulus strips at the cell width, so an N x M grid needs
+        # N + M thumbnails rather than N x M composites. Finished cells are cached too, so
+        # shifting the grid by one column only stacks the new column.
+        key = frame_key(top_path, bottom_path, cell_w, cell_h)
+        frame = self.cache.get(key)
+        if frame is None:
+            top = stimulus_strip(self.cache, top_path, cell_w, self.store)
+            bottom = stimulus_strip(self.cache, bottom_path, cell_w, self.store)
+            frame = self.cache.put(key, stack_strips(top, bottom, cell_w, cell_h))
+        return frame
+
+    def preview_cell(self, top_path, bottom_path, cell_w, cell_h):
+        # Finished cells as they are. Strips already in memory or in the thumbnail store are used
+        # as they are, so after the first session a cell is final without decoding anything;
+        # only stimuli without a strip are drawn quickly from the reduced decodes.
+        key = frame_key(top_path, bottom_path, cell_w, cell_h)
+        frame = self.cache.get(key)
+        if frame is not None:
+            return frame, True
+        top = cached_strip(self.cache, top_path, cell_w, self.store)
+        bottom = cached_strip(self.cache, bottom_path, cell_w, self.store)
+        if top is not None and bottom is not None:
+            return self.cache.put(key, stack_strips(top, bottom, cell_w, cell_h)), True
+        if top is None:
+            top = preview_stimulus(self.cache, top_path, cell_w, strip_height(top_path, cell_w))
+        if bottom is None:
+            bottom = preview_stimulus(self.cache, bottom_path, cell_w, strip_height(bottom_path, cell_w))
+        return stack_strips(top, bottom, cell_w, cell_h), False
+
+    def _render_safe(self, top_path, bottom_path, cell_w, cell_h, preview):
+        try:
+            if preview:
+                return self.preview_cell(top_path, bottom_path, cell_w, cell_h) + (None,)
+            return self.render_cell(top_path, bottom_path, cell_w, cell_h), True, None
+        except Exception as e:
+            return None, False, e
+
+    def render(self, pairs, cell_w, cell_h, preview=False):
+        # Returns [(row, col, top, bottom, image or None, final, error or None)] in the order given;
+        # final is False for preview cells that still need the full-quality pass
+        futures = [self.executor.submit(self._render_safe, top, bottom, cell_w, cell_h, preview)
+                   for _, _, top, bottom in pairs]
+        return [pair + future.result() for pair, future in zip(pairs, futures)]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
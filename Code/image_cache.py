@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageChops
+
+# Default decoded-image budget (bytes) shared by single view, grid view and save
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+# Bytes per pixel Pillow keeps in memory for each mode (everything else is 4)
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2}
+
+# Line stimuli without colour are kept as "L" (1 byte a pixel) and pure black/white ones
+# bit-packed (1 bit a pixel) instead of RGBA. MATCHPROGRAM_COMPACT=0 restores plain RGBA.
+COMPACT_STIMULI = os.environ.get("MATCHPROGRAM_COMPACT", "1") != "0"
+
+
+def image_nbytes(image):
+    # NumPy arrays (normalised stimuli for batch compositing) report their own size
+    if hasattr(image, "nbytes"):
+        return image.nbytes
+    return image.width * image.height * MODE_BYTES.get(image.mode, 4)
+
+
+def file_key(path):
+    # (path, mtime, size) so an edited or replaced file is never served stale
+    st = os.stat(path)
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def as_grayscale(img):
+    # The image as "L" when that loses nothing, else None. Only opaque images qualify: with
+    # transparency the RGBA pipeline resamples differently (premultiplied alpha).
+    if img.mode == "L":
+        return img
+    if img.mode == "1":
+        return img.convert("L")
+    if img.mode in ("LA", "RGBA", "PA", "La", "RGBa") or "transparency" in img.info:
+        if img.convert("RGBA").getchannel("A").getextrema() != (255, 255):
+            return None
+    rgb = img.convert("RGB")
+    r, g, b = rgb.split()
+    if ImageChops.difference(r, g).getbbox() or ImageChops.difference(g, b).getbbox():
+        return None
+    return r
+
+
+def on_white(img):
+    # Transparent background counts as white paper; opaque images are returned as they are
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        background = Image.new("RGBA", img.size, "white")
+        return Image.alpha_composite(background, img.convert("RGBA"))
+    return img
+
+
+class PackedBitmap:
+    # A pure black/white stimulus packed 8 pixels to a byte, as held in the cache
+    def __init__(self, image):
+        self.size = image.size
+        self.data = image.convert("1", dither=Image.Dither.NONE).tobytes()
+        self.nbytes = len(self.data)
+
+    def unpack(self):
+        return Image.frombytes("1", self.size, self.data).convert("L")
+
+
+def decode_stimulus(path):
+    # Full resolution: "L" or PackedBitmap for colourless stimuli, otherwise RGBA
+    with Image.open(path) as img:
+        img.load()
+        gray = as_grayscale(img) if COMPACT_STIMULI else None
+        if gray is None:
+            return img.convert("RGBA")
+    colors = gray.getcolors(2)
+    if colors and all(value in (0, 255) for _, value in colors):
+        return PackedBitmap(gray)
+    return gray
+
+
+# --Decoded Image Cache--
+class ImageCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (image, nbytes), oldest first
+        # Shared with the prefetch threads
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> Event set once the decode in flight finishes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, image):
+        nbytes = image_nbytes(image)
+        if nbytes > self.max_bytes:
+            # Never let a single huge stimulus flush the whole cache
+            return image
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+
+            self._entries[key] = (image, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+        return image
+
+    def load(self, path, variant="full", loader=decode_stimulus):
+        # Cached images are shared: callers must copy before mutating in place
+        image = self._load(path, variant, loader)
+        if not isinstance(image, PackedBitmap):
+            return image
+        # The unpacked image is cached alongside under the same budget, so a stimulus in use (a
+        # top saved against every bottom) is unpacked once; idle ones shrink back to their bits
+        key = file_key(path) + (variant, "unpacked")
+        unpacked = self.get(key)
+        return unpacked if unpacked is not None else self.put(key, image.unpack())
+
+    def _load(self, path, variant, loader):
+        key = file_key(path) + (variant,)
+        image = self.get(key)
+        if image is not None:
+            return image
+
+        # If another thread is already decoding this file, wait for it instead of decoding twice
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key][0]
+            pending = self._loading.get(key)
+            if pending is None:
+                self._loading[key] = threading.Event()
+        if pending is not None:
+            pending.wait()
+            image = self.get(key)
+            return image if image is not None else self.put(key, loader(path))
+
+        try:
+            return self.put(key, loader(path))
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Navigation latency tracing. The UI opens an event per keypress/redraw and the rendering code
+# marks phases inside it; both are no-ops until tracing is enabled. Phases run on other threads
+# (prefetch, grid workers) are kept as separate spans so they still show in the exported trace.
+#   MATCHPROGRAM_TRACE=trace.json python Combine_Final.py  -> F3 toggles the HUD, trace written on close
+# The file opens in chrome://tracing or https://ui.perfetto.dev
+
+MAX_EVENTS = 1000
+
+
+class LatencyTracer:
+    def __init__(self, enabled=False, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.events = deque(maxlen=max_events)  # finished events, oldest first
+        self.spans = deque(maxlen=max_events * 20)  # (name, thread id, start ns, duration ns) off the event thread
+        self.origin = time.perf_counter_ns()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def event(self, name, **args):
+        # Nested events (a redraw triggering another) are folded into the outer one
+        if not self.enabled or getattr(self._local, "event", None) is not None:
+            yield None
+            return
+        event = {"name": name, "args": args, "tid": threading.get_ident(),
+                 "start": time.perf_counter_ns(), "dur": 0, "phases": []}
+        self._local.event = event
+        try:
+            yield event
+        finally:
+            self._local.event = None
+            event["dur"] = time.perf_counter_ns() - event["start"]
+            self.events.append(event)
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            dur = time.perf_counter_ns() - start
+            event = getattr(self._local, "event", None)
+            if event is not None:
+                event["phases"].append((name, start, dur))
+            else:
+                with self._lock:
+                    self.spans.append((name, threading.get_ident(), start, dur))
+
+    # --Summaries--
+    def percentiles(self, *ps):
+        # Event latency in milliseconds at each percentile, e.g. percentiles(50, 95)
+        durations = sorted(e["dur"] for e in self.events)
+        if not durations:
+            return None
+        return [durations[min(len(durations) - 1, int(len(durations) * p / 100))] / 1e6 for p in ps]
+
+    def breakdown(self, event):
+        # {phase: total ms} for one event; phases mark leaf operations, so they do not overlap
+        totals = {}
+        for name, _, dur in event["phases"]:
+            totals[name] = totals.get(name, 0) + dur / 1e6
+        return totals
+
+    def hud_text(self):
+        if not self.events:
+            return "no events yet"
+        last = self.events[-1]
+        p50, p95 = self.percentiles(50, 95)
+        phases = sorted(self.breakdown(last).items(), key=lambda item: -item[1])[:5]
+        return (f"last {last['dur'] / 1e6:.1f} ms · p50 {p50:.1f} · p95 {p95:.1f} (n={len(self.events)})\n" +
+                "  ".join(f"{name} {ms:.1f}" for name, ms in phases))
+
+    # --Export--
+    def export_chrome(self, path):
+        # Chrome trace event format: complete ("X") events in microseconds
+        pid = os.getpid()
+
+        def span(name, tid, start, dur, args=None):
+            entry = {"name": name, "ph": "X", "pid": pid, "tid": tid,
+                     "ts": (start - self.origin) / 1000, "dur": dur / 1000}
+            if args:
+                entry["args"] = args
+            return entry
+
+        trace = []
+        for event in list(self.events):
+            trace.append(span(event["name"], event["tid"], event["start"], event["dur"], event["args"]))
+            trace.extend(span(name, event["tid"], start, dur) for name, start, dur in event["phases"])
+        with self._lock:
+            trace.extend(span(*s) for s in self.spans)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+# Shared by the UI and the rendering modules
+tracer = LatencyTracer()
+phase = tracer.phase
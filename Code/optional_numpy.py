@@ -0,0 +1,6 @@
+# NumPy is optional: np is None without it, and the features that need it (batch compositing,
+# seam matching) fall back or switch themselves off
+try:
+    import numpy as np
+except ImportError:
+    np = None
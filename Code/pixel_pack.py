@@ -0,0 +1,185 @@
+import hashlib
+import json
+import mmap
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from combiner import probe_size, scaled_stimulus
+from image_cache import PackedBitmap, decode_stimulus, file_key
+from thumb_store import user_cache_dir
+from latency_trace import phase
+
+# Packs are normalised to this width (or the widest stimulus, if narrower): enough for any
+# screen, small enough that a few hundred stimuli map comfortably
+PACK_WIDTH = 1600
+PACK_VERSION = 2
+
+# Stimuli decoded at once while building; each is full resolution until it is normalised
+PACK_WORKERS = min(4, os.cpu_count() or 2)
+
+# Packs made by other app instances for the same folder are reused, so they live in one place
+PACK_DIR = user_cache_dir("packs")
+
+_packs = {}  # stimulus path -> PixelPack holding it
+
+
+def pack_base(folder, recursive):
+    key = f"{os.path.abspath(folder)}|{int(recursive)}".encode()
+    return os.path.join(PACK_DIR, hashlib.blake2b(key, digest_size=12).hexdigest())
+
+
+def _normalized(path, width):
+    image = decode_stimulus(path)
+    if isinstance(image, PackedBitmap):
+        image = image.unpack()
+    height = max(1, round(image.height * width / image.width))
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    return image
+
+
+# --Pixel Pack--
+# Every stimulus of a folder decoded once, resized to a common width and written back to back
+# into one raw file, each as "L" when it is grayscale, otherwise RGBA (the modes Pillow can
+# wrap without copying). The file is memory-mapped read-only, so a stimulus is a slice of the
+# map, and every process opening the same pack shares the OS page cache.
+class PixelPack:
+    def __init__(self, index):
+        self.width = index["width"]
+        self.entries = index["entries"]  # path -> {"offset", "height", "mode", "size", "mtime_ns"}
+        self.data_path = os.path.join(PACK_DIR, index["data"])
+        with open(self.data_path, "rb") as f:
+            # The map outlives the file handle; images made from it keep it alive
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+    def image(self, path):
+        # Zero-copy image of the packed stimulus, or None if it is not packed or changed since
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        try:
+            _, mtime_ns, size = file_key(path)
+        except OSError:
+            return None
+        if (entry["mtime_ns"], entry["size"]) != (mtime_ns, size):
+            return None
+        mode = entry["mode"]
+        nbytes = self.width * entry["height"] * len(mode)
+        data = self.view[entry["offset"]:entry["offset"] + nbytes]
+        return Image.frombuffer(mode, (self.width, entry["height"]), data, "raw", mode, 0, 1)
+
+    def stale(self, paths):
+        return [p for p in paths if self.image(p) is None]
+
+
+def build_pack(folder, paths, recursive=False, width=None, workers=PACK_WORKERS):
+    if width is None:
+        width = min(PACK_WIDTH, max(probe_size(p)[0] for p in paths))
+
+    base = pack_base(folder, recursive)
+    os.makedirs(PACK_DIR, exist_ok=True)
+    # Pixels go to a new file each build and the index is swapped last, so an instance opening the
+    # pack meanwhile always gets an index and pixel file that belong together
+    data_path = f"{base}.{os.getpid()}.{time.time_ns()}.bin"
+    tmp_path = f"{base}.{os.getpid()}.part"
+    old = load_index(base)
+    entries = {}
+    offset = 0
+    try:
+        # Stimuli are written in order as they finish; at most two per worker are decoded or waiting
+        # to be written at any time, so memory does not grow with the folder
+        with ThreadPoolExecutor(max_workers=workers) as pool, open(data_path, "wb") as f:
+            pending = deque()
+            for path in paths:
+                pending.append((path, pool.submit(_normalized, path, width)))
+                if len(pending) >= workers * 2:
+                    offset = _write_entry(f, entries, offset, *pending.popleft())
+            while pending:
+                offset = _write_entry(f, entries, offset, *pending.popleft())
+
+        index = {"version": PACK_VERSION, "data": os.path.basename(data_path),
+                 "width": width, "entries": entries}
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp_path, base + ".json")
+    except BaseException:
+        # The index was never swapped in, so nothing refers to these files
+        for path in (data_path, tmp_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+
+    if old and old.get("data") != index["data"]:
+        try:
+            # Instances still mapping the old pixels keep them until they close (fails on Windows
+            # while mapped; the file is then left for the next build)
+            os.remove(os.path.join(PACK_DIR, old["data"]))
+        except (OSError, KeyError):
+            pass
+    return PixelPack(index)
+
+
+def _write_entry(f, entries, offset, path, future):
+    image = future.result()
+    _, mtime_ns, size = file_key(path)
+    data = image.tobytes()
+    f.write(data)
+    entries[path] = {"offset": offset, "height": image.height, "mode": image.mode,
+                     "size": size, "mtime_ns": mtime_ns}
+    return offset + len(data)
+
+
+def load_index(base):
+    try:
+        with open(base + ".json") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get("version") == PACK_VERSION else None
+
+
+def load_pack(folder, recursive=False):
+    index = load_index(pack_base(folder, recursive))
+    try:
+        return index and PixelPack(index)
+    except (OSError, ValueError):
+        return None
+
+
+def open_pack(folder, paths, recursive=False):
+    # Reuses the pack when it still matches every stimulus, otherwise builds it again
+    if not paths:
+        return None
+    pack = load_pack(folder, recursive)
+    if pack is None or pack.stale(paths):
+        pack = build_pack(folder, paths, recursive)
+    for path in paths:
+        _packs[path] = pack
+    return pack
+
+
+def forget_pack(paths):
+    # Back to decoding the image files, e.g. after the folder is reloaded without packing
+    for path in paths:
+        _packs.pop(path, None)
+
+
+def packed_stimulus(cache, path, width, height, resample=Image.Resampling.LANCZOS):
+    # Scale function for render_pair: resized straight from the map, no file is opened.
+    # Stimuli that are not packed (or changed since) take the normal decode path.
+    pack = _packs.get(path)
+    image = pack and pack.image(path)
+    if image is None:
+        return scaled_stimulus(cache, path, width, height, resample)
+    with phase("resize"):
+        image = image.resize((width, height), resample, reducing_gap=2.0)
+    return image if image.mode == "L" else image.convert("RGB")
+
+
+def packed_preview(cache, path, width, height):
+    return packed_stimulus(cache, path, width, height, Image.Resampling.BILINEAR)
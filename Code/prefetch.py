@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# How many stimuli to warm on each side of the current one, per axis
+DEFAULT_PREFETCH_RADIUS = 4
+
+
+def step_direction(old, new, count):
+    # +1/-1/0 along a wrapping axis, taking the short way round
+    if old is None or count == 0 or old == new:
+        return 0
+    forward = (new - old) % count
+    return 1 if forward <= count - forward else -1
+
+
+# --Neighbour Prefetch--
+class PrefetchScheduler:
+    def __init__(self, warm, radius=DEFAULT_PREFETCH_RADIUS, workers=2):
+        # warm(top_path, bottom_path) is called on a worker thread and should fill the shared cache
+        self.warm = warm
+        self.radius = radius
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.pending = {}  # (top_path, bottom_path) -> Future
+        self.last_top = None
+        self.last_bottom = None
+        self.top_dir = 1
+        self.bottom_dir = 1
+
+    def axis_order(self, count, index, span, direction):
+        # Indices just outside the visible span, nearest first, ahead of the direction of travel before behind it
+        first, last = index, index + span - 1
+        ahead_edge, behind_edge = (last, first) if direction > 0 else (first, last)
+        ahead = [(ahead_edge + k * direction) % count for k in range(1, self.radius + 1)]
+        behind = [(behind_edge - k * direction) % count for k in range(1, self.radius + 1)]
+        return ahead, behind
+
+    def update(self, top_paths, bottom_paths, top_idx, bottom_idx, top_span=1, bottom_span=1):
+        # Called from the Tk thread after every navigation step
+        n_top, n_bottom = len(top_paths), len(bottom_paths)
+        if not n_top or not n_bottom:
+            return
+        d = step_direction(self.last_top, top_idx, n_top)
+        self.top_dir = d or self.top_dir
+        d = step_direction(self.last_bottom, bottom_idx, n_bottom)
+        self.bottom_dir = d or self.bottom_dir
+        self.last_top, self.last_bottom = top_idx, bottom_idx
+
+        visible_tops = [(top_idx + k) % n_top for k in range(top_span)]
+        visible_bottoms = [(bottom_idx + k) % n_bottom for k in range(bottom_span)]
+        tops_ahead, tops_behind = self.axis_order(n_top, top_idx, top_span, self.top_dir)
+        bottoms_ahead, bottoms_behind = self.axis_order(n_bottom, bottom_idx, bottom_span, self.bottom_dir)
+
+        # Pairs the user can reach next: a new column of tops against the visible bottoms,
+        # or a new row of bottoms against the visible tops. Both axes are interleaved.
+        # The visible pairs themselves were just rendered on the Tk thread.
+        wanted = []
+        for k in range(self.radius):
+            wanted += [(tops_ahead[k], b) for b in visible_bottoms]
+            wanted += [(t, bottoms_ahead[k]) for t in visible_tops]
+            wanted += [(tops_behind[k], b) for b in visible_bottoms]
+            wanted += [(t, bottoms_behind[k]) for t in visible_tops]
+        wanted = list(dict.fromkeys((top_paths[t], bottom_paths[b]) for t, b in wanted))
+
+        # Drop queued work that fell out of the window (e.g. the user reversed direction)
+        wanted_set = set(wanted)
+        for pair, future in list(self.pending.items()):
+            if future.done() or (pair not in wanted_set and future.cancel()):
+                del self.pending[pair]
+
+        for pair in wanted:
+            if pair not in self.pending:
+                self.pending[pair] = self.executor.submit(self._run, *pair)
+
+    def _run(self, top_path, bottom_path):
+        try:
+            self.warm(top_path, bottom_path)
+        except Exception:
+            # Unreadable files are reported when they are actually displayed
+            pass
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,65 @@
+import os
+import queue
+import threading
+from batch_render import save_atomic
+
+# Format by file extension; anything else falls back to PNG
+EXTENSION_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".tif": "TIFF", ".tiff": "TIFF", ".bmp": "BMP"}
+
+
+# --Background Save Queue--
+# Save jobs are composited and encoded on a writer thread in the order they were queued.
+# The Tk side calls poll() from the mainloop to collect finished jobs; nothing here touches Tk.
+class SaveQueue:
+    def __init__(self, render, compress_level=6, jpeg_quality=95):
+        # render(top_path, bottom_path) -> PIL image, called on the writer thread
+        self.render = render
+        self.compress_level = compress_level
+        self.jpeg_quality = jpeg_quality
+        self.jobs = queue.Queue()
+        self.done = queue.Queue()  # (path, error message or None)
+        self.pending = 0
+        self.thread = threading.Thread(target=self._run, name="save-writer", daemon=True)
+        self.thread.start()
+
+    def save_params(self, path):
+        fmt = EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), "PNG")
+        if fmt == "PNG":
+            return fmt, {"compress_level": self.compress_level}
+        if fmt == "JPEG":
+            return fmt, {"quality": self.jpeg_quality}
+        return fmt, {}
+
+    def submit(self, top_path, bottom_path, out_path):
+        self.pending += 1
+        self.jobs.put((top_path, bottom_path, out_path))
+
+    def poll(self):
+        # Finished jobs since the last call, from the Tk thread
+        finished = []
+        while True:
+            try:
+                finished.append(self.done.get_nowait())
+            except queue.Empty:
+                break
+        self.pending -= len(finished)
+        return finished
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            top_path, bottom_path, out_path = job
+            try:
+                fmt, params = self.save_params(out_path)
+                save_atomic(self.render(top_path, bottom_path), out_path, fmt, params)
+                self.done.put((out_path, None))
+            except Exception as e:
+                self.done.put((out_path, str(e)))
+
+    def shutdown(self, wait=True):
+        # Queued saves are still written before the thread exits
+        self.jobs.put(None)
+        if wait:
+            self.thread.join()
@@ -0,0 +1,145 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from optional_numpy import np
+from stimulus_index import index_folder
+from image_cache import on_white
+
+# Seam compatibility: how well the lines leaving the bottom edge of a top stimulus meet the
+# lines entering the top edge of a bottom stimulus once both are scaled to a common width,
+# as combine_full does. Each stimulus is reduced to two ink profiles (one value per column
+# along its top and bottom edge) and all pairs are scored at once with matrix products.
+
+SEAM_WIDTH = 256  # columns per profile
+EDGE_ROWS = 3  # rows at the edge (at SEAM_WIDTH) that count as touching it
+TOLERANCE = 2  # columns a line may be off by and still meet its partner
+
+# Boundary signatures: a column counts as inked above this much ink, and a pair is compatible
+# when at most MAX_UNMATCHED inked columns (either side) find nothing to meet
+INK_LEVEL = 0.5
+MAX_UNMATCHED = 2
+SIGNATURE_FIELD = f"edges{SEAM_WIDTH}"  # manifest key, named by width so a change invalidates it
+
+
+def edge_profiles(path):
+    # (2, SEAM_WIDTH) float32 array: ink along the top edge, ink along the bottom edge (0 = paper)
+    with Image.open(path) as img:
+        height = max(EDGE_ROWS * 2, round(img.height * SEAM_WIDTH / img.width))
+        img.draft("L", (SEAM_WIDTH, height))
+        small = on_white(img).convert("L").resize((SEAM_WIDTH, height), Image.Resampling.BOX)
+    ink = 1 - np.asarray(small, dtype=np.float32) / 255
+    return np.stack([ink[:EDGE_ROWS].max(axis=0), ink[-EDGE_ROWS:].max(axis=0)])
+
+
+def widen(profiles):
+    # Each column takes the strongest ink within TOLERANCE columns of it
+    padded = np.pad(profiles, ((0, 0), (TOLERANCE, TOLERANCE)))
+    return np.max([padded[:, i:i + SEAM_WIDTH] for i in range(2 * TOLERANCE + 1)], axis=0)
+
+
+def compatibility_matrix(top_edges, bottom_edges):
+    # top_edges: (n, SEAM_WIDTH) bottom-edge profiles of the tops; bottom_edges: (m, SEAM_WIDTH)
+    # top-edge profiles of the bottoms. Returns (n, m) scores in [0, 1]: the share of ink on
+    # both edges that finds a partner on the other side (1 = every line continues).
+    matched = top_edges @ widen(bottom_edges).T + widen(top_edges) @ bottom_edges.T
+    total = top_edges.sum(axis=1)[:, None] + bottom_edges.sum(axis=1)[None, :]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = np.where(total > 0, matched / total, 0)
+    return np.clip(scores, 0, 1)
+
+
+def ranked_pairs(scores):
+    # (top indices, bottom indices, scores) of every pair from best to worst, as arrays;
+    # ties keep top-major order
+    order = np.argsort(-scores, axis=None, kind="stable")
+    tops, bottoms = np.unravel_index(order, scores.shape)
+    return tops, bottoms, scores.ravel()[order]
+
+
+# --Matcher--
+class SeamMatcher:
+    def __init__(self, cache, workers=None):
+        self.cache = cache
+        self.workers = workers or min(8, os.cpu_count() or 2)
+
+    def profiles(self, paths):
+        # Profiles are small and kept in the shared cache, so rescoring after a folder change
+        # only decodes the new folder
+        def load(path):
+            return self.cache.load(path, variant=("seam", SEAM_WIDTH), loader=edge_profiles)
+
+        def safe(path):
+            try:
+                return load(path)
+            except Exception:
+                # Unreadable stimuli score 0 against everything
+                return np.zeros((2, SEAM_WIDTH), np.float32)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return np.stack(list(pool.map(safe, paths)))
+
+    def scores(self, top_paths, bottom_paths):
+        tops = self.profiles(top_paths)
+        bottoms = self.profiles(bottom_paths)
+        return compatibility_matrix(tops[:, 1], bottoms[:, 0])
+
+    def ranking(self, top_paths, bottom_paths):
+        return ranked_pairs(self.scores(top_paths, bottom_paths))
+
+
+# --Boundary Signatures--
+def edge_signature(path):
+    # Inked columns along the top and bottom edge packed into bits: 2 x 32 bytes, as hex for the manifest
+    return np.packbits(edge_profiles(path) > INK_LEVEL, axis=1).tobytes().hex()
+
+
+def widen_bits(bits):
+    return np.packbits(widen(np.unpackbits(bits, axis=1)) > 0, axis=1)
+
+
+def popcount(bits):
+    return np.unpackbits(bits, axis=1).sum(axis=1)
+
+
+def folder_signatures(folder, recursive, paths):
+    # (len(paths), 2, 32) uint8 signatures, kept in the folder manifest so only new or changed
+    # stimuli are ever decoded for this; unreadable stimuli get an empty signature
+    found = index_folder(folder, recursive).fill(SIGNATURE_FIELD, edge_signature)
+    empty = bytes(SEAM_WIDTH // 4)
+    data = b"".join(bytes.fromhex(found.get(path, "")) or empty for path in paths)
+    return np.frombuffer(data, np.uint8).reshape(len(paths), 2, SEAM_WIDTH // 8)
+
+
+class BoundaryIndex:
+    # Which bottoms a top can continue into, decided with bitwise operations on the signatures
+    def __init__(self, top_signatures, bottom_signatures):
+        self.top_bits = top_signatures[:, 1]  # bottom edge of each top
+        self.bottom_bits = bottom_signatures[:, 0]  # top edge of each bottom
+        self.top_wide = widen_bits(self.top_bits)
+        self.bottom_wide = widen_bits(self.bottom_bits)
+        self._masks = {}  # top index -> bool array over the bottoms
+
+    @classmethod
+    def from_folders(cls, top_source, top_paths, bottom_source, bottom_paths):
+        # sources are the (folder, recursive) the paths were listed from
+        return cls(folder_signatures(*top_source, top_paths), folder_signatures(*bottom_source, bottom_paths))
+
+    def compatible(self, top_idx):
+        mask = self._masks.get(top_idx)
+        if mask is None:
+            # Ink on the bottom's edge with nothing above it, plus ink on the top's edge with nothing below
+            unmatched = (popcount(self.bottom_bits & ~self.top_wide[top_idx]) +
+                         popcount(self.top_bits[top_idx] & ~self.bottom_wide))
+            mask = self._masks[top_idx] = unmatched <= MAX_UNMATCHED
+        return mask
+
+    def step(self, top_idx, bottom_idx, direction):
+        # Next compatible bottom after bottom_idx going forward (1) or back (-1), wrapping; None if none
+        candidates = np.flatnonzero(self.compatible(top_idx))
+        if not len(candidates):
+            return None
+        if direction > 0:
+            later = candidates[candidates > bottom_idx]
+            return int(later[0] if len(later) else candidates[0])
+        earlier = candidates[candidates < bottom_idx]
+        return int(earlier[-1] if len(earlier) else candidates[-1])
@@ -0,0 +1,50 @@
+from array import array
+
+
+# --Session Store--
+# Records which combinations were viewed, not their pixels: paths and render parameters are
+# interned once and every entry is three small integers in typed arrays (12 bytes a pair), plus
+# one packed integer in a dict so a combination is only stored once (about 130 bytes a pair in all).
+# Pixels are regenerated on demand through the image cache.
+class SessionStore:
+    def __init__(self):
+        self.paths = []  # id -> path
+        self.path_ids = {}  # path -> id
+        self.params = []  # id -> render parameters (hashable tuple)
+        self.param_ids = {}
+        self.tops = array("I")
+        self.bottoms = array("I")
+        self.param_idx = array("I")
+        self.index = {}  # top id, bottom id and params id packed into one int -> entry
+
+    def _intern(self, value, values, ids):
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(values)
+            values.append(value)
+        return value_id
+
+    def add(self, top_path, bottom_path, params=()):
+        # Returns the entry index; viewing the same combination again does not add a new entry
+        top = self._intern(top_path, self.paths, self.path_ids)
+        bottom = self._intern(bottom_path, self.paths, self.path_ids)
+        param = self._intern(params, self.params, self.param_ids)
+        # Ids fit the arrays' 32 bits, so the packed key is unique
+        key = (top << 64) | (bottom << 32) | param
+        entry = self.index.get(key)
+        if entry is None:
+            entry = self.index[key] = len(self.tops)
+            self.tops.append(top)
+            self.bottoms.append(bottom)
+            self.param_idx.append(param)
+        return entry
+
+    def __len__(self):
+        return len(self.tops)
+
+    def __getitem__(self, i):
+        return self.paths[self.tops[i]], self.paths[self.bottoms[i]], self.params[self.param_idx[i]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,174 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from dedup import perceptual_hash
+
+VALID_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tiff")
+
+# Kept next to the stimuli so any machine opening the folder (e.g. over SMB) can reuse it
+MANIFEST_NAME = ".matchprogram_manifest.json"
+MANIFEST_VERSION = 1
+
+# Header probes are latency bound on network shares, not CPU bound
+PROBE_WORKERS = 16
+
+
+def probe_dims(path):
+    # Image.open only parses the header; pixels are never decoded here
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def scan_folder(folder, recursive=False):
+    # One os.scandir pass per directory: {relpath: (size, mtime_ns)} and {reldir: mtime_ns}
+    files = {}
+    dirs = {}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        path = os.path.join(folder, rel_dir) if rel_dir else folder
+        dirs[rel_dir] = os.stat(path).st_mtime_ns
+        with os.scandir(path) as it:
+            for entry in it:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not entry.name.startswith("."):
+                        stack.append(rel_path)
+                elif entry.name.lower().endswith(VALID_EXTS):
+                    st = entry.stat()
+                    files[rel_path] = (st.st_size, st.st_mtime_ns)
+    return files, dirs
+
+
+# --Folder Index--
+class FolderIndex:
+    def __init__(self, folder, recursive, entries, dirs):
+        self.folder = folder
+        self.recursive = recursive
+        self.entries = entries  # relpath -> {"size", "mtime_ns", "width", "height", ...}
+        self.dirs = dirs  # reldir -> mtime_ns when the index was built
+        self.paths = [os.path.join(folder, rel) for rel in sorted(entries)]
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.folder, MANIFEST_NAME)
+
+    def entry(self, path):
+        return self.entries.get(os.path.relpath(path, self.folder))
+
+    def fill(self, field, compute, persist=True, progress=None):
+        # {path: value} of a per-stimulus field (JSON-serialisable), computed in parallel for entries
+        # that do not have it yet and then kept in the manifest with the dimensions. Stimuli that
+        # could not be decoded are stored as None and left out. Each value is stored as
+        # [size, mtime_ns, value] and computed again once the file no longer matches: the fast
+        # path of index_folder does not notice files overwritten in place. progress(done, total) is
+        # called on the calling thread as missing values come in.
+        rels = list(self.entries)
+        with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+            stamps = dict(zip(rels, pool.map(_stamp, [os.path.join(self.folder, rel) for rel in rels])))
+            missing = [rel for rel, stamp in stamps.items()
+                       if stamp and (self.entries[rel].get(field) or [None])[:2] != stamp]
+            if missing:
+                paths = [os.path.join(self.folder, rel) for rel in missing]
+                results = pool.map(lambda p: _safe(compute, p), paths)
+                for done, (rel, value) in enumerate(zip(missing, results), 1):
+                    self.entries[rel][field] = stamps[rel] + [value]
+                    if progress:
+                        progress(done, len(missing))
+        if missing and persist:
+            self.save()
+        return {os.path.join(self.folder, rel): self.entries[rel][field][2]
+                for rel, stamp in stamps.items() if stamp and self.entries[rel][field][2] is not None}
+
+    def perceptual_hashes(self, persist=True, progress=None):
+        # {path: hash}, stored as hex in the manifest
+        hashes = self.fill("phash", lambda p: format(perceptual_hash(p), "x"), persist, progress)
+        return {path: int(value, 16) for path, value in hashes.items()}
+
+    def save(self):
+        manifest = {"version": MANIFEST_VERSION, "recursive": self.recursive,
+                    "dirs": self.dirs, "files": self.entries}
+        try:
+            # Written in place rather than renamed: creating the manifest bumps the folder's own
+            # mtime, so that is recorded and written once more (rewriting an existing file does not)
+            for _ in range(2):
+                with open(self.manifest_path, "w") as f:
+                    json.dump(manifest, f, separators=(",", ":"))
+                root_mtime = os.stat(self.folder).st_mtime_ns
+                if self.dirs.get("") == root_mtime:
+                    break
+                self.dirs[""] = root_mtime
+        except OSError:
+            # Read-only share: the index still works, it is just rebuilt next time
+            pass
+
+
+def _stamp(path):
+    # [size, mtime_ns], or None for a file that has gone
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _safe(compute, path):
+    try:
+        return compute(path)
+    except Exception:
+        return None
+
+
+def load_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def dirs_unchanged(folder, dirs):
+    # Adding, removing or renaming a file bumps its directory's mtime
+    try:
+        return all(os.stat(os.path.join(folder, rel) if rel else folder).st_mtime_ns == mtime
+                   for rel, mtime in dirs.items())
+    except OSError:
+        return False
+
+
+def index_folder(folder, recursive=False, persist=True):
+    manifest = load_manifest(folder)
+    if manifest and manifest["recursive"] == recursive and dirs_unchanged(folder, manifest["dirs"]):
+        # Fast path: no directory changed since the manifest was written, nothing is listed or opened.
+        # Files edited in place keep their name; the image cache still keys decodes on (mtime, size).
+        return FolderIndex(folder, recursive, manifest["files"], manifest["dirs"])
+
+    files, dirs = scan_folder(folder, recursive)
+    known = manifest["files"] if manifest else {}
+    entries = {}
+    to_probe = []
+    for rel, (size, mtime_ns) in files.items():
+        old = known.get(rel)
+        if old and old["size"] == size and old["mtime_ns"] == mtime_ns:
+            entries[rel] = old
+        else:
+            entries[rel] = {"size": size, "mtime_ns": mtime_ns}
+            to_probe.append(rel)
+
+    if to_probe:
+        with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+            for rel, dims in zip(to_probe, pool.map(probe_dims, [os.path.join(folder, r) for r in to_probe])):
+                if dims:
+                    entries[rel]["width"], entries[rel]["height"] = dims
+
+    index = FolderIndex(folder, recursive, entries, dirs)
+    if persist and (not manifest or to_probe or entries.keys() != known.keys() or dirs != manifest["dirs"]):
+        index.save()
+    return index
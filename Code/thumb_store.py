@@ -0,0 +1,107 @@
+import hashlib
+import os
+import sys
+import threading
+from PIL import Image
+from image_cache import file_key
+
+# Default on-disk budget for stimulus thumbnails, shared by every app instance on the machine
+DEFAULT_THUMB_BYTES = 256 * 1024 * 1024
+
+# Trim the store once this share of the budget has been written since the last trim
+TRIM_EVERY = 0.1
+
+
+def user_cache_dir(name):
+    # Per-user cache folder for one kind of data, e.g. user_cache_dir("thumbs")
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+        return os.path.join(base, "MatchProgram", name)
+    if sys.platform == "darwin":
+        return os.path.expanduser(f"~/Library/Caches/MatchProgram/{name}")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "matchprogram", name)
+
+
+_hashes = {}  # file_key -> hex digest, so a stimulus is only read once per session
+
+
+def content_hash(path):
+    # Keyed on content rather than path: renamed, moved or copied stimuli keep their thumbnails
+    key = file_key(path)
+    digest = _hashes.get(key)
+    if digest is None:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = _hashes[key] = h.hexdigest()
+    return digest
+
+
+# --Persistent Thumbnail Store--
+# One small PNG per (content hash, thumbnail size), fanned out over 256 subfolders. Files are
+# written to a private temp name and renamed into place, so concurrent instances never see a
+# partial thumbnail; a hit touches the file's mtime, which is what the LRU trim goes by.
+# Files another instance removes mid-trim or mid-read are simply treated as misses.
+class ThumbnailStore:
+    def __init__(self, root=None, max_bytes=DEFAULT_THUMB_BYTES):
+        # MATCHPROGRAM_THUMB_DIR overrides, e.g. to share a store between accounts on a lab machine
+        self.root = root or os.environ.get("MATCHPROGRAM_THUMB_DIR") or user_cache_dir("thumbs")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._written = max_bytes  # trim on the first write of the session
+
+    def path_for(self, digest, width, height):
+        return os.path.join(self.root, digest[:2], f"{digest}_{width}x{height}.png")
+
+    def get(self, path, width, height):
+        try:
+            thumb_path = self.path_for(content_hash(path), width, height)
+            with Image.open(thumb_path) as img:
+                img.load()
+            os.utime(thumb_path)
+        except (OSError, ValueError):
+            return None
+        return img
+
+    def put(self, path, width, height, image):
+        try:
+            thumb_path = self.path_for(content_hash(path), width, height)
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            tmp_path = f"{thumb_path}.{os.getpid()}.{threading.get_ident()}.part"
+            image.save(tmp_path, format="PNG", compress_level=1)
+            os.replace(tmp_path, thumb_path)
+            nbytes = os.path.getsize(thumb_path)
+        except OSError:
+            # Read-only or full disk: thumbnails still work, they are just not kept
+            return
+
+        with self._lock:
+            self._written += nbytes
+            if self._written < self.max_bytes * TRIM_EVERY:
+                return
+            self._written = 0
+        self.trim()
+
+    def trim(self):
+        # Oldest-used first until the store is back under 90% of its budget
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                full = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, full))
+        total = sum(size for _, size, _ in files)
+        files.sort()
+        for _, size, full in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,158 @@
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import *
+from PIL import ImageOps, ImageTk
+
+
+# --Virtualized Gallery--
+# Scrollable thumbnail grid that only builds thumbnails and canvas items for the rows in
+# (or just outside) the viewport. Items are recycled as the user scrolls and thumbnails are
+# made on worker threads, so opening and scrolling cost the same for 10 or 10,000 entries.
+class VirtualGallery:
+    def __init__(self, parent, count, loader, thumb_size=300, cols=3, bg="#333",
+                 padding=5, overscan_rows=1, max_thumbs=256, workers=2):
+        # loader(index) -> PIL image; called on a worker thread
+        self.loader = loader
+        self.count = count
+        self.thumb_size = thumb_size
+        self.cols = cols
+        self.padding = padding
+        self.pitch = thumb_size + 2 * padding
+        self.overscan_rows = overscan_rows
+        self.max_thumbs = max_thumbs
+
+        self.canvas = Canvas(parent, bg=bg, highlightthickness=0)
+        self.scroll_y = Scrollbar(parent, orient="vertical", command=self._yview)
+        self.canvas.configure(yscrollcommand=self.scroll_y.set)
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gallery")
+        self.results = queue.Queue()  # (index, thumbnail or None) from the workers
+        self.pending = {}  # index -> Future
+        self.thumbs = OrderedDict()  # index -> PIL thumbnail (LRU)
+        self.slots = {}  # index -> (canvas item, PhotoImage or None) for visible entries
+        self.free_items = []  # canvas items ready for reuse
+        self.poll_job = None
+
+        self.canvas.bind("<Configure>", lambda e: self.refresh())
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self._yview("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self._yview("scroll", 1, "units"))
+        self._update_scrollregion()
+
+    def pack(self):
+        self.canvas.pack(side=LEFT, fill=BOTH, expand=True)
+        self.scroll_y.pack(side=RIGHT, fill=Y)
+
+    def pack_forget(self):
+        self.canvas.pack_forget()
+        self.scroll_y.pack_forget()
+
+    def destroy(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.poll_job:
+            self.canvas.after_cancel(self.poll_job)
+        self.canvas.destroy()
+        self.scroll_y.destroy()
+
+    def set_count(self, count):
+        self.count = count
+        self._update_scrollregion()
+        self.refresh()
+
+    def invalidate(self):
+        # Entries changed in place: drop cached thumbnails and rebuild what is visible
+        self.thumbs.clear()
+        for index in list(self.slots):
+            self._release(index)
+        self.refresh()
+
+    # Scrolling
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def _on_wheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        step = -1 if event.delta > 0 else 1
+        self._yview("scroll", step, "units")
+
+    def _update_scrollregion(self):
+        rows = (self.count + self.cols - 1) // self.cols
+        self.canvas.configure(scrollregion=(0, 0, self.cols * self.pitch, rows * self.pitch),
+                              yscrollincrement=self.pitch // 4)
+
+    def visible_range(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + max(1, self.canvas.winfo_height())
+        first_row = max(0, int(top // self.pitch) - self.overscan_rows)
+        last_row = int(bottom // self.pitch) + self.overscan_rows
+        return first_row * self.cols, min(self.count, (last_row + 1) * self.cols)
+
+    # Slots
+    def refresh(self):
+        start, stop = self.visible_range()
+        wanted = range(start, stop)
+
+        # Recycle items that scrolled away and drop their queued thumbnail work
+        for index in [i for i in self.slots if i not in wanted]:
+            self._release(index)
+        for index, future in list(self.pending.items()):
+            if index not in wanted and future.cancel():
+                del self.pending[index]
+
+        for index in wanted:
+            if index in self.slots:
+                continue
+            item = self.free_items.pop() if self.free_items else self.canvas.create_image(0, 0, anchor="center")
+            row, col = divmod(index, self.cols)
+            self.canvas.coords(item, col * self.pitch + self.pitch // 2, row * self.pitch + self.pitch // 2)
+            self.slots[index] = (item, None)
+            thumb = self.thumbs.get(index)
+            if thumb is not None:
+                self.thumbs.move_to_end(index)
+                self._show(index, thumb)
+            elif index not in self.pending:
+                self.pending[index] = self.executor.submit(self._build, index)
+
+        if self.pending and self.poll_job is None:
+            self.poll_job = self.canvas.after(30, self._poll)
+
+    def _release(self, index):
+        item, _ = self.slots.pop(index)
+        self.canvas.itemconfigure(item, image="")
+        self.free_items.append(item)
+
+    def _show(self, index, thumb):
+        item, _ = self.slots[index]
+        photo = ImageTk.PhotoImage(thumb if thumb.mode == "RGB" else thumb.convert("RGB"))
+        self.canvas.itemconfigure(item, image=photo)
+        self.slots[index] = (item, photo)  # Keep reference
+
+    # Thumbnails
+    def _build(self, index):
+        try:
+            image = self.loader(index)
+            thumb = ImageOps.contain(image, (self.thumb_size, self.thumb_size))
+        except Exception:
+            thumb = None
+        self.results.put((index, thumb))
+
+    def _poll(self):
+        # Tk is not thread-safe: worker results are handed over through the queue
+        self.poll_job = None
+        while True:
+            try:
+                index, thumb = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.pop(index, None)
+            if thumb is None:
+                continue
+            self.thumbs[index] = thumb
+            if len(self.thumbs) > self.max_thumbs:
+                self.thumbs.popitem(last=False)
+            if index in self.slots:
+                self._show(index, thumb)
+        if self.pending:
+            self.poll_job = self.canvas.after(30, self._poll)